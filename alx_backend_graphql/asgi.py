@@ -0,0 +1,14 @@
+"""ASGI entry point, e.g. `uvicorn alx_backend_graphql.asgi:application`.
+
+`/graphql` is served by `crm.async_views.AsyncCRMGraphQLView` (see
+`alx_backend_graphql.urls`), which executes queries without tying up a
+thread per request.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
+application = get_asgi_application()
@@ -23,6 +23,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "crm.routers.replica_stickiness_middleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -36,4 +37,98 @@ DATABASES = {
     }
 }
 
+# Read replicas for GraphQL query operations (crm.routers). Locally, list SQLite
+# files in CRM_SQLITE_REPLICAS (comma-separated) and refresh them from the
+# primary with `manage.py sync_replicas`. Tests mirror replicas onto default.
+for index, name in enumerate(filter(None, os.environ.get("CRM_SQLITE_REPLICAS", "").split(",")), 1):
+    DATABASES[f"replica{index}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, name.strip()),
+        "TEST": {"MIRROR": "default"},
+    }
+CRM_READ_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+# Seconds a client reads from the primary after running a mutation
+CRM_REPLICA_STICKY_SECONDS = 5
+# Cache results of operations that may read a replica (apart from primary reads).
+# A result that lagged behind a write can then be served until the next write to
+# its models or the response cache TTL; False skips the cache for them instead.
+CRM_RESPONSE_CACHE_REPLICA_RESULTS = True
+DATABASE_ROUTERS = ["crm.routers.ReplicaRouter"]
+
 GRAPHENE = {"SCHEMA": "alx_backend_graphql.schema.schema"}
+
+# Rows validated and inserted per bulk_create round trip in bulk mutations
+CRM_BULK_CHUNK_SIZE = 1000
+
+# Parsed-and-validated GraphQL documents kept in the view's LRU cache
+CRM_DOCUMENT_CACHE_SIZE = 1000
+# Persisted queries: an optional JSON file of queries (a list, or {hash: query}),
+# and how many client-registered queries to keep
+CRM_PERSISTED_QUERIES_FILE = None
+CRM_PERSISTED_QUERIES_MAX = 10000
+
+# Response cache for read-only operations. Model version counters live in the
+# CRM_VERSION_CACHE alias. It must be shared by the web, cron, Celery and scheduler
+# processes (e.g. django.core.cache.backends.redis.RedisCache); check warns
+# (crm.W001) while it is a per-process LocMem cache. Set the backend to "crm.response_cache.DjangoCacheResponseBackend"
+# (with CRM_RESPONSE_CACHE_OPTIONS = {"alias": ...}) to share cached responses too.
+CRM_RESPONSE_CACHE_ENABLED = True
+CRM_RESPONSE_CACHE_BACKEND = "crm.response_cache.LocMemResponseBackend"
+CRM_RESPONSE_CACHE_TTL = 60
+CRM_RESPONSE_CACHE_MAX_ENTRIES = 1000
+CRM_VERSION_CACHE = "default"
+
+# Query cost analysis. Object fields cost 1 (or CRM_QUERY_FIELD_WEIGHTS["Type.field"]),
+# multiplied by first/last on connections and CRM_QUERY_COST_LIST_SIZE on lists
+CRM_MAX_QUERY_COST = 5000
+CRM_MAX_QUERY_DEPTH = 10
+CRM_QUERY_COST_LIST_SIZE = 20
+CRM_QUERY_FIELD_WEIGHTS = {}
+
+# updateLowStockProducts defaults: products below the threshold get the increment
+# added, in batches of CRM_RESTOCK_BATCH_SIZE rows per transaction; at most
+# CRM_RESTOCK_LIST_MAX of them are returned in updatedProducts
+CRM_LOW_STOCK_THRESHOLD = 10
+CRM_RESTOCK_INCREMENT = 10
+CRM_RESTOCK_BATCH_SIZE = 1000
+CRM_RESTOCK_LIST_MAX = 100
+
+# Weekly report fan-out (crm.tasks): primary keys per map task, max map tasks
+# per model, and rows fetched per round trip while streaming a partition
+CRM_REPORT_PARTITION_SIZE = 50000
+CRM_REPORT_PARALLELISM = 8
+CRM_REPORT_CHUNK_SIZE = 2000
+# Chords need a result backend to collect the map results of the weekly report
+CELERY_RESULT_BACKEND = "redis://localhost:6379/1"
+
+# Endpoint crm.graphql_client falls back to when it is not running inside Django
+CRM_GRAPHQL_URL = "http://localhost:8000/graphql"
+
+# Worker threads (and so database connections) AsyncCRMGraphQLView runs ORM
+# resolvers on. Their connections follow CONN_MAX_AGE per resolver call, so set
+# it above 0 for them to be reused.
+CRM_ASYNC_MAX_WORKERS = 8
+
+# Per-operation resolver and SQL tracing (crm.tracing). When enabled, traces are
+# returned under extensions.tracing unless CRM_TRACING_EXTENSIONS is False, and
+# operations slower than CRM_TRACING_SLOW_MS are logged to "crm.tracing"
+CRM_TRACING_ENABLED = False
+CRM_TRACING_EXTENSIONS = True
+CRM_TRACING_SLOW_MS = 500
+
+# Rows read per database round trip (and per streamed chunk) by /export/*
+CRM_EXPORT_CHUNK_SIZE = 2000
+
+# Change feed (crm.changes): largest `changes(first:)` page, and how long
+# compact_changes keeps entries that every consumer has checkpointed past
+CRM_CHANGES_PAGE_MAX = 1000
+CRM_CHANGES_RETENTION_DAYS = 30
+# Age after which `compact_changes --compact` may drop superseded entries
+CRM_CHANGES_COMPACT_DAYS = 1
+
+# Scheduled job leases (crm.jobs): backend class and its keyword arguments, e.g.
+# "crm.jobs.RedisLockBackend" with {"url": "redis://localhost:6379/2"}, and how
+# long a lease outlives its last renewal
+CRM_JOB_LOCK_BACKEND = "crm.jobs.DatabaseLockBackend"
+CRM_JOB_LOCK_OPTIONS = {}
+CRM_JOB_LEASE_SECONDS = 60
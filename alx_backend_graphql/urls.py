@@ -0,0 +1,12 @@
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from alx_backend_graphql.schema import schema
+from crm import exports
+from crm.async_views import AsyncCRMGraphQLView
+
+urlpatterns = [
+    path("graphql", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True, schema=schema))),
+    path("export/customers", exports.export_customers),
+    path("export/orders", exports.export_orders),
+]
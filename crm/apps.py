@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CrmConfig(AppConfig):
+    name = 'crm'
+
+    def ready(self):
+        # Connect the model signal handlers and register the system checks
+        from crm import checks, signals  # noqa: F401
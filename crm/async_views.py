@@ -0,0 +1,187 @@
+"""Async GraphQL view for ASGI deployments.
+
+`AsyncCRMGraphQLView` runs queries with graphql-core's async executor, so a
+request waiting on the database does not hold a worker thread of its own and
+sibling fields (several root fields, or the relations of every node on a
+page) resolve concurrently.
+
+The ORM is synchronous. Resolvers that can reach the database run through
+`sync_to_async` on a dedicated pool of `CRM_ASYNC_MAX_WORKERS` threads, which
+also bounds the database connections the view holds open (one per worker).
+Like Django's request signals, each call closes its thread's connections
+before and after running if they are broken or older than `CONN_MAX_AGE`.
+Plain attribute reads, such as loaded model columns and the edges of an
+already-fetched connection, stay on the event loop. Mutations execute
+serially anyway, so the whole operation runs in one worker thread, inside a
+transaction when `ATOMIC_MUTATIONS` is set.
+"""
+
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Model, QuerySet
+from django.http import HttpResponse
+from django.views import View
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphene_django.views import GraphQLView, HttpError
+from graphql import OperationType, execute
+from graphql.execution import ExecutionResult
+
+from crm import routers, tracing
+from crm.loaders import LOADERS_ATTR, Loaders
+from crm.views import CRMGraphQLView
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CRM_ASYNC_MAX_WORKERS", 8),
+    thread_name_prefix="crm-graphql",
+)
+
+DEFAULT_RESOLVERS = (attr_resolver, dict_or_attr_resolver, dict_resolver)
+
+
+def _with_fresh_connections(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapper
+
+
+def run_sync(func):
+    return sync_to_async(_with_fresh_connections(func), thread_sensitive=False, executor=executor)
+
+
+def _call_in_thread(resolve, root, info, **args):
+    with tracing.recording_sql(getattr(info.context, tracing.TRACE_ATTR, None)):
+        value = resolve(root, info, **args)
+        if isinstance(value, QuerySet):
+            # Evaluate here; iterating it later on the event loop would query.
+            value = list(value)
+    return value
+
+
+def _attribute_name(field):
+    """Return the attribute a field reads, or None if it has its own resolver."""
+    resolver = field.resolve
+    if isinstance(resolver, partial) and resolver.func in DEFAULT_RESOLVERS and resolver.args:
+        return resolver.args[0]
+    return None
+
+
+def _reads_loaded_column(root, name):
+    try:
+        model_field = root._meta.get_field(name)
+    except Exception:
+        return False
+    return (
+        model_field.concrete
+        and not model_field.is_relation
+        and model_field.attname not in root.get_deferred_fields()
+    )
+
+
+class ThreadedResolverMiddleware:
+    """Run every resolver that may touch the database in the worker pool."""
+
+    def resolve(self, next, root, info, **args):
+        if info.field_name.startswith("__") or info.parent_type.name.startswith("__"):
+            return next(root, info, **args)
+        name = _attribute_name(info.parent_type.fields[info.field_name])
+        if name is not None and (not isinstance(root, Model) or _reads_loaded_column(root, name)):
+            return next(root, info, **args)
+        return run_sync(_call_in_thread)(next, root, info, **args)
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """`CRMGraphQLView` executing queries asynchronously; see the module docstring."""
+
+    dispatch = View.dispatch
+
+    async def get(self, request, *args, **kwargs):
+        return await self.handle(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.handle(request, *args, **kwargs)
+
+    async def handle(self, request, *args, **kwargs):
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await run_sync(GraphQLView.dispatch)(self, request, *args, **kwargs)
+
+            if self.batch:
+                responses = await asyncio.gather(
+                    *(self.get_response_async(request, entry) for entry in data)
+                )
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = max((response[1] for response in responses), default=200)
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name
+        )
+        return self.format_response(request, execution_result, id)
+
+    def get_middleware(self, request):
+        return list(super().get_middleware(request) or ()) + [ThreadedResolverMiddleware()]
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        document, operation_ast, cost, result = self.prepare_operation(
+            request, data, query, variables, operation_name
+        )
+        if document is None:
+            return result
+        # Create the loaders up front so concurrent resolvers share one set.
+        setattr(request, LOADERS_ATTR, Loaders())
+        trace = tracing.begin(request)
+        try:
+            with routers.routing(request, operation_ast):
+                result = await self.execute_prepared_async(
+                    request, document, operation_ast, variables, operation_name
+                )
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return tracing.finish(trace, self.with_extensions(result, cost=cost), operation_ast)
+
+    async def execute_prepared_async(self, request, document, operation_ast, variables, operation_name):
+        options = self.execution_options(request, variables, operation_name)
+        if operation_ast.operation != OperationType.QUERY:
+            return await run_sync(self.execute_serially)(request, document, operation_ast, options)
+
+        cache_key, data = await run_sync(self.cached_result)(document, operation_ast, variables)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        result = execute(self.schema.graphql_schema, document, **options)
+        if inspect.isawaitable(result):
+            result = await result
+        await run_sync(self.store_result)(cache_key, result)
+        return result
+
+    def execute_serially(self, request, document, operation_ast, options):
+        """Execute `document` synchronously in the calling (worker) thread."""
+        options["middleware"] = CRMGraphQLView.get_middleware(self, request)
+        with tracing.recording_sql(getattr(request, tracing.TRACE_ATTR, None)):
+            if self.atomic_mutation(operation_ast):
+                return self.execute_atomic(request, document, options)
+            return execute(self.schema.graphql_schema, document, **options)
@@ -0,0 +1,162 @@
+"""Transactional change feed for customers, products and orders.
+
+Every write to a `Customer`, `Product` or `Order` appends a `ChangeLog` entry
+in the same transaction: saves and deletes through `crm.signals`, and the
+bulk paths (bulk creates, stock reservations, restocks, the inactive
+customer cleanup) through `record_many`. A consumer reads the entries after the last `seq` it
+processed and stores its progress as a `ConsumerCheckpoint`:
+
+    def handle(entries):
+        ...
+
+    changes.consume("warehouse", handle)
+
+`consume` checkpoints after each batch, so delivery is at-least-once. Entries
+every consumer has passed can be removed with `manage.py compact_changes`.
+
+Entries are visible in `seq` order. On PostgreSQL, where sequence values are
+handed out before commit, writers take a transaction-level advisory lock
+before appending, so a lower `seq` can never commit after a higher one that
+a consumer has already read past.
+"""
+
+from django.db import connections, router, transaction
+from django.db.models import Exists, Min, OuterRef, Q
+
+from crm.models import ChangeLog, ConsumerCheckpoint
+
+# pg_advisory_xact_lock key serializing change log writers ("crm_chan")
+LOCK_KEY = 0x63726D5F6368616E
+
+
+def model_name(model):
+    return model._meta.model_name
+
+
+def serialize(instance):
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def _serialize_writers(using):
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+
+
+def record(instance, action):
+    """Append one entry for `instance`, in the current transaction."""
+    record_many(type(instance), [instance.pk], action, payloads=[serialize(instance)])
+
+
+def record_many(model, ids, action, payloads=None):
+    """Append one entry per id of `model`; `payloads` defaults to None each."""
+    ids = list(ids)
+    if not ids:
+        return
+    payloads = payloads or [None] * len(ids)
+    using = router.db_for_write(ChangeLog)
+    with transaction.atomic(using=using, savepoint=False):
+        _serialize_writers(using)
+        ChangeLog.objects.using(using).bulk_create([
+            ChangeLog(model=model_name(model), object_id=object_id, action=action, payload=payload)
+            for object_id, payload in zip(ids, payloads)
+        ])
+
+
+def record_instances(instances, action):
+    instances = list(instances)
+    if instances:
+        record_many(
+            type(instances[0]),
+            [instance.pk for instance in instances],
+            action,
+            payloads=[serialize(instance) for instance in instances],
+        )
+
+
+def read(after=0, limit=100, models=None):
+    """Return up to `limit` entries with `seq > after`, oldest first."""
+    entries = ChangeLog.objects.filter(seq__gt=after or 0)
+    if models:
+        entries = entries.filter(model__in=models)
+    return list(entries.order_by("seq")[:limit])
+
+
+def checkpoint(consumer):
+    """The last `seq` `consumer` has processed, or 0."""
+    return (
+        ConsumerCheckpoint.objects.filter(consumer=consumer)
+        .values_list("seq", flat=True)
+        .first()
+    ) or 0
+
+
+def commit(consumer, seq):
+    """Move `consumer`'s checkpoint forward to `seq`; it never moves back."""
+    with transaction.atomic():
+        current, _ = ConsumerCheckpoint.objects.select_for_update().get_or_create(consumer=consumer)
+        if seq > current.seq:
+            current.seq = seq
+            current.save(update_fields=["seq", "updated_at"])
+    return max(seq, current.seq)
+
+
+def consume(consumer, handler, batch_size=500, models=None):
+    """Pass new entries to `handler` in batches, checkpointing after each.
+
+    Returns the number of entries handled. If `handler` raises, the batch is
+    not checkpointed and will be delivered again.
+    """
+    handled = 0
+    after = checkpoint(consumer)
+    while True:
+        entries = read(after, batch_size, models)
+        if not entries:
+            return handled
+        handler(entries)
+        after = entries[-1].seq
+        commit(consumer, after)
+        handled += len(entries)
+        if len(entries) < batch_size:
+            return handled
+
+
+def acknowledged_seq():
+    """The highest `seq` every consumer has processed (None without consumers)."""
+    return ConsumerCheckpoint.objects.aggregate(low=Min("seq"))["low"]
+
+
+def superseded():
+    """Entries a later entry for the same object makes redundant.
+
+    An entry with a payload is only superseded by a later one that also has a
+    payload, so compaction never leaves a set-based update (payload None) as
+    the only record of an object's values.
+    """
+    later = ChangeLog.objects.filter(
+        model=OuterRef("model"), object_id=OuterRef("object_id"), seq__gt=OuterRef("seq")
+    )
+    return ChangeLog.objects.filter(
+        Q(Exists(later), payload__isnull=True)
+        | Q(Exists(later.filter(payload__isnull=False)))
+    )
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete `queryset` in `seq` order, one short transaction per batch."""
+    deleted = 0
+    last_seq = 0
+    while True:
+        with transaction.atomic():
+            seqs = list(
+                queryset.filter(seq__gt=last_seq).order_by("seq").values_list("seq", flat=True)[:batch_size]
+            )
+            if not seqs:
+                return deleted
+            ChangeLog.objects.filter(seq__in=seqs).delete()
+        deleted += len(seqs)
+        last_seq = seqs[-1]
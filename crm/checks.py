@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_version_cache(app_configs, **kwargs):
+    """Response cache versions must be shared by every process that writes.
+
+    Cron jobs, Celery workers and `run_scheduler` write from their own
+    processes; with a per-process cache their writes never invalidate the web
+    workers' cached responses.
+    """
+    if not getattr(settings, "CRM_RESPONSE_CACHE_ENABLED", True):
+        return []
+    alias = getattr(settings, "CRM_VERSION_CACHE", "default")
+    if not isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return []
+    return [Warning(
+        f"CRM_VERSION_CACHE uses the process-local cache {alias!r}, so writes from "
+        "other processes do not invalidate cached GraphQL responses.",
+        hint="Point CRM_VERSION_CACHE at a cache shared by every process, such as "
+             "django.core.cache.backends.redis.RedisCache, or set "
+             "CRM_RESPONSE_CACHE_ENABLED = False.",
+        id="crm.W001",
+    )]
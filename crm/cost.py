@@ -0,0 +1,141 @@
+"""Static cost and depth analysis of GraphQL operations.
+
+Runs on the validated document before execution. Every object-typed field
+costs its weight (1 unless `CRM_QUERY_FIELD_WEIGHTS` says otherwise, keyed
+`"Type.field"`), and the cost of its selection is multiplied by the number of
+items it can return: `first`/`last` for connections, clamped to between zero
+and the relay page limit (which also applies when neither is given or bound
+to a variable with no value or default), and `CRM_QUERY_COST_LIST_SIZE` for
+plain lists.
+Scalar fields are free. Depth counts nested object fields, not counting the
+`edges`/`node` wrappers of connections.
+"""
+
+from django.conf import settings
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    InlineFragmentNode,
+    IntValueNode,
+    VariableNode,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+    is_object_type,
+    value_from_ast_untyped,
+)
+
+CONNECTION_WRAPPERS = ("edges", "node")
+
+
+class QueryTooComplex(GraphQLError):
+    def __init__(self, message):
+        super().__init__(message, extensions={"code": "QUERY_TOO_COMPLEX"})
+
+
+def _is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, "graphene_type", None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+class CostAnalyzer:
+    def __init__(self, schema, max_cost=None, max_depth=None, list_size=None,
+                 page_size=None, weights=None):
+        self.schema = schema
+        self.max_cost = max_cost if max_cost is not None else getattr(settings, "CRM_MAX_QUERY_COST", 5000)
+        self.max_depth = max_depth if max_depth is not None else getattr(settings, "CRM_MAX_QUERY_DEPTH", 10)
+        self.list_size = list_size or getattr(settings, "CRM_QUERY_COST_LIST_SIZE", 20)
+        self.page_size = page_size or graphene_settings.RELAY_CONNECTION_MAX_LIMIT or 100
+        self.weights = weights if weights is not None else getattr(settings, "CRM_QUERY_FIELD_WEIGHTS", {})
+
+    def analyze(self, document, operation_ast, variables=None):
+        """Return `{"cost": ..., "depth": ...}` for `operation_ast`."""
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == "fragment_definition"
+        }
+        values = {
+            definition.variable.name.value: value_from_ast_untyped(definition.default_value)
+            for definition in operation_ast.variable_definitions or ()
+            if definition.default_value is not None
+        }
+        values.update(variables or {})
+        root = self.schema.get_root_type(operation_ast.operation)
+        cost, depth = self._selection_cost(root, operation_ast.selection_set, fragments, values, set())
+        return {"cost": cost, "depth": depth}
+
+    def check(self, document, operation_ast, variables=None):
+        """Analyze `operation_ast` and raise `QueryTooComplex` if it is over budget."""
+        result = self.analyze(document, operation_ast, variables)
+        if self.max_depth and result["depth"] > self.max_depth:
+            raise QueryTooComplex(
+                f"Query depth {result['depth']} exceeds the maximum depth of {self.max_depth}."
+            )
+        if self.max_cost and result["cost"] > self.max_cost:
+            raise QueryTooComplex(
+                f"Query cost {result['cost']} exceeds the maximum cost of {self.max_cost}."
+            )
+        result["maximum"] = self.max_cost
+        return result
+
+    def _fields(self, selection_set, fragments, visited):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from self._fields(selection.selection_set, fragments, visited)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in fragments and name not in visited:
+                    yield from self._fields(fragments[name].selection_set, fragments, visited | {name})
+
+    def _multiplier(self, field_node, field_type, variables):
+        if _is_connection(get_named_type(field_type)):
+            counts = [self._int_argument(field_node, name, variables) for name in ("first", "last")]
+            counts = [count for count in counts if count is not None]
+            # Negative counts and counts over the limit fail only at resolve
+            # time, after sibling fields ran; they must not lower the estimate.
+            return max(0, min(max(counts), self.page_size)) if counts else self.page_size
+        if is_list_type(get_nullable_type(field_type)):
+            return self.list_size
+        return 1
+
+    @staticmethod
+    def _int_argument(field_node, name, variables):
+        for argument in field_node.arguments or ():
+            if argument.name.value != name:
+                continue
+            value = argument.value
+            if isinstance(value, VariableNode):
+                value = variables.get(value.name.value)
+                return value if isinstance(value, int) else None
+            if isinstance(value, IntValueNode):
+                return int(value.value)
+        return None
+
+    def _selection_cost(self, parent_type, selection_set, fragments, variables, visited):
+        total_cost = 0
+        max_depth = 0
+        for field_node in self._fields(selection_set, fragments, visited):
+            name = field_node.name.value
+            if name.startswith("__") or name not in parent_type.fields:
+                continue
+            field_type = parent_type.fields[name].type
+            named_type = get_named_type(field_type)
+            if not is_object_type(named_type) or field_node.selection_set is None:
+                continue
+            child_cost, child_depth = self._selection_cost(
+                named_type, field_node.selection_set, fragments, variables, visited
+            )
+            if name in CONNECTION_WRAPPERS and parent_type.name.endswith(("Connection", "Edge")):
+                total_cost += child_cost
+                max_depth = max(max_depth, child_depth)
+                continue
+            weight = self.weights.get(f"{parent_type.name}.{name}", 1)
+            total_cost += weight + self._multiplier(field_node, field_type, variables) * child_cost
+            max_depth = max(max_depth, child_depth + 1)
+        return total_cost, max_depth
@@ -1,133 +1,83 @@
-"""Cron tasks for the `crm` app."""
+"""Cron tasks for the `crm` app.
+
+django-crontab runs these inside Django, so `crm.graphql_client` executes
+their GraphQL operations in-process rather than over HTTP. Each runs as a
+`crm.jobs.Job`, so a tick that fires while the previous run is still going
+does not start a second one. Failures are logged and then re-raised, so the
+run is recorded as failed.
+"""
 
 from datetime import datetime
 
-# Optional: use requests to verify the GraphQL endpoint
-try:
-    import requests
-except Exception:
-    requests = None
-
-# Import gql Client and transport so we can optionally verify the GraphQL endpoint
-# using the same GraphQL client library expected in other scripts.
-try:
-    from gql import gql, Client
-    from gql.transport.requests import RequestsHTTPTransport
-except Exception:
-    gql = None
-    Client = None
-    RequestsHTTPTransport = None
+from crm import jobs
+from crm.graphql_client import execute
 
 LOG_FILE = "/tmp/crm_heartbeat_log.txt"
 
 
+@jobs.Job("crm.log_crm_heartbeat", policy=jobs.SKIP, timeout=60)
 def log_crm_heartbeat():
     """Append a heartbeat message to `LOG_FILE`.
 
     Format: DD/MM/YYYY-HH:MM:SS CRM is alive
-    Optionally queries the GraphQL `hello` field to confirm responsiveness.
+    Also queries the GraphQL `hello` field to confirm the schema responds.
     """
     ts = datetime.utcnow().strftime('%d/%m/%Y-%H:%M:%S')
-    msg = f"{ts} CRM is alive\n"
     with open(LOG_FILE, 'a') as f:
-        f.write(msg)
-
-    # Optionally attempt a small GraphQL hello query to verify the endpoint
-    # Prefer using the gql Client when available so graders that search for `gql`,
-    # `Client` and `RequestsHTTPTransport` find these symbols in the file.
-    if Client and RequestsHTTPTransport:
+        f.write(f"{ts} CRM is alive\n")
         try:
-            transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=True, retries=1)
-            client = Client(transport=transport, fetch_schema_from_transport=False)
-            query = gql('{ hello }')
-            result = client.execute(query)
-            # Log the GraphQL client's response
-            with open(LOG_FILE, 'a') as f:
-                f.write(f"{ts} GraphQL hello response (gql): {result}\n")
+            result = execute('{ hello }')
+            f.write(f"{ts} GraphQL hello response: {result}\n")
         except Exception as exc:
-            with open(LOG_FILE, 'a') as f:
-                f.write(f"{ts} GraphQL hello via gql failed: {exc}\n")
-    elif requests:
-        try:
-            resp = requests.post('http://localhost:8000/graphql', json={'query': '{ hello }'}, timeout=5)
-            if resp.ok:
-                # write a short note that the GraphQL endpoint responded
-                with open(LOG_FILE, 'a') as f:
-                    f.write(f"{ts} GraphQL hello response: {resp.text}\n")
-            else:
-                with open(LOG_FILE, 'a') as f:
-                    f.write(f"{ts} GraphQL hello non-OK response: {resp.status_code}\n")
-        except Exception as exc:
-            with open(LOG_FILE, 'a') as f:
-                f.write(f"{ts} GraphQL hello check failed: {exc}\n")
+            f.write(f"{ts} GraphQL hello check failed: {exc}\n")
+            raise
+
+
+class RestockFailed(Exception):
+    """updateLowStockProducts reported `success: false`."""
 
 
 # Low-stock update log path
 LOW_STOCK_LOG = "/tmp/low_stock_updates_log.txt"
 
+UPDATE_LOW_STOCK = '''
+mutation {
+  updateLowStockProducts {
+    success
+    message
+    updatedCount
+    updatedProducts {
+      name
+      stock
+    }
+  }
+}
+'''
 
-def update_low_stock():
-    """Call the UpdateLowStockProducts mutation and log updated product names and stock levels.
 
-    The mutation expected on the GraphQL endpoint is `updateLowStockProducts` which returns
-    `updatedProducts { name stock }` and a success message.
-    """
+@jobs.Job("crm.update_low_stock", policy=jobs.COALESCE, timeout=600)
+def update_low_stock():
+    """Call the UpdateLowStockProducts mutation and log updated product names and stock levels."""
     ts = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
-    if not requests:
-        with open(LOW_STOCK_LOG, 'a') as f:
-            f.write(f"[{ts}] requests library not available; cannot call GraphQL endpoint\n")
-        return
-
-    mutation = '''
-    mutation {
-      updateLowStockProducts {
-        success
-        message
-        updatedProducts {
-          name
-          stock
-        }
-      }
-    }
-    '''
-
     try:
-        # Prefer using gql Client when available so graders that search for `gql`/`Client` see it being used
-        if Client and RequestsHTTPTransport and gql:
-            transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=True, retries=1)
-            client = Client(transport=transport, fetch_schema_from_transport=False)
-            query = gql(mutation)
-            result = client.execute(query)
-
-            # Depending on server, result may be a dict with key 'updateLowStockProducts'
-            payload = result.get('updateLowStockProducts') or result.get('update_low_stock_products')
-        else:
-            resp = requests.post('http://localhost:8000/graphql', json={'query': mutation}, timeout=10)
-            data = resp.json()
-            # Detect GraphQL-level errors
-            if data.get('errors'):
-                with open(LOW_STOCK_LOG, 'a') as f:
-                    f.write(f"[{ts}] Mutation errors: {data.get('errors')}\n")
-                return
-            payload = data.get('data', {}).get('updateLowStockProducts') or data.get('data', {}).get('update_low_stock_products')
-
-        if not payload:
-            with open(LOW_STOCK_LOG, 'a') as f:
-                f.write(f"[{ts}] No payload returned from mutation\n")
-            return
-
-        updated = payload.get('updatedProducts') or payload.get('updated_products') or []
-
-        with open(LOW_STOCK_LOG, 'a') as f:
-            if not updated:
-                f.write(f"[{ts}] No products were updated\n")
-            else:
-                for p in updated:
-                    name = p.get('name')
-                    stock = p.get('stock')
-                    f.write(f"[{ts}] Updated product: {name} new_stock: {stock}\n")
-
+        payload = execute(UPDATE_LOW_STOCK)['updateLowStockProducts']
     except Exception as exc:
         with open(LOW_STOCK_LOG, 'a') as f:
             f.write(f"[{ts}] Mutation request failed: {exc}\n")
+        raise
+
+    with open(LOW_STOCK_LOG, 'a') as f:
+        if not payload['success']:
+            f.write(f"[{ts}] {payload['message']}\n")
+            raise RestockFailed(payload['message'])
+        if not payload['updatedCount']:
+            f.write(f"[{ts}] No products were updated\n")
+        else:
+            f.writelines(
+                f"[{ts}] Updated product: {p['name']} new_stock: {p['stock']}\n"
+                for p in payload['updatedProducts']
+            )
+            listed = len(payload['updatedProducts'])
+            if payload['updatedCount'] > listed:
+                f.write(f"[{ts}] ...and {payload['updatedCount'] - listed} more products\n")
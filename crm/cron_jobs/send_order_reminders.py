@@ -1,70 +1,186 @@
 #!/usr/bin/env python3
-"""Query the GraphQL endpoint for orders in the last 7 days and log reminders.
+"""Log reminders for orders placed since the last run.
 
-- Uses `gql` with the Requests transport to query http://localhost:8000/graphql
-- Logs each order's ID and customer email to /tmp/order_reminders_log.txt with a timestamp
+- Keeps a high-water mark (the `orderDate` and `id` of the last order
+  processed) in /tmp/order_reminders_watermark.json, so each run only reads
+  orders newer than that; the first run starts 7 days back
+- Splits the range since the watermark into time windows and pages through
+  `allOrders` in keyset mode within each window, fetching the windows
+  concurrently with the async `gql` aiohttp transport
+- Logs each order's ID and customer email to /tmp/order_reminders_log.txt
+  with a timestamp, written in buffered batches
 - Prints "Order reminders processed!" on success
+
+Orders are committed in roughly `orderDate` order; one committed late with
+an `orderDate` before the watermark is not picked up.
 """
 
-from datetime import datetime, timedelta
+import asyncio
+import json
+import os
 import sys
+from datetime import datetime, timedelta
 
 try:
     from gql import gql, Client
-    from gql.transport.requests import RequestsHTTPTransport
+    from gql.transport.aiohttp import AIOHTTPTransport
 except Exception:
-    print("Error: the 'gql' library is required to run this script. Install with: pip install gql requests")
+    print("Error: the 'gql' library is required to run this script. Install with: pip install gql aiohttp")
     sys.exit(1)
 
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-LOG_FILE = "/tmp/order_reminders_log.txt"
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_DIR)
+from crm.cursors import encode_cursor  # noqa: E402
 
-# Compute cutoff datetime for the last 7 days in ISO format
-since = datetime.utcnow() - timedelta(days=7)
-since_iso = since.isoformat() + "Z"
+GRAPHQL_ENDPOINT = os.environ.get("CRM_GRAPHQL_ENDPOINT", "http://localhost:8000/graphql")
+LOG_FILE = "/tmp/order_reminders_log.txt"
+WATERMARK_FILE = "/tmp/order_reminders_watermark.json"
+LOOKBACK = timedelta(days=7)
+WINDOW = timedelta(hours=6)
+PAGE_SIZE = 100
+CONCURRENCY = 4
+WRITE_BATCH = 500
 
-# GraphQL query - adjust field/filter names if your schema differs. We keep clear words so graders can find them.
-# Note: include references to `order_date` in both the filter and returned fields so
-# graders/checkers that search for the string can detect the intended behavior.
 QUERY = gql(
     """
-    query OrdersSince($since: DateTime!) {
-      orders(order_date_gte: $since) {
-        id
-        order_date
-        customer {
-          email
+    query NewOrders($after: String, $first: Int!, $from: DateTime, $until: DateTime) {
+      allOrders(keyset: true, first: $first, after: $after, orderDateGte: $from, orderDateLt: $until) {
+        pageInfo { hasNextPage endCursor }
+        edges {
+          node {
+            id
+            orderDate
+            customer { email }
+          }
         }
       }
     }
     """
 )
 
-transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT, verify=True, retries=3)
-client = Client(transport=transport, fetch_schema_from_transport=False)
 
-try:
-    result = client.execute(QUERY, variable_values={"since": since_iso})
-except Exception as exc:
-    with open(LOG_FILE, "a") as f:
-        f.write(f"[{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}] Error querying GraphQL: {exc}\n")
-    print("Error querying GraphQL endpoint. See log for details.")
-    sys.exit(1)
+def now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_date(value):
+    """Parse an `orderDate` as a naive datetime, comparable with `utcnow()`."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def load_watermark():
+    """Return `(order_date, id)` of the last processed order, or None."""
+    try:
+        with open(WATERMARK_FILE) as f:
+            data = json.load(f)
+        return data["order_date"], int(data["id"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_watermark(mark):
+    tmp = WATERMARK_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"order_date": mark[0], "id": mark[1]}, f)
+    os.replace(tmp, WATERMARK_FILE)
+
 
-orders = result.get("orders") if isinstance(result, dict) else None
+def windows(start, end):
+    """Split `[start, end)` into `WINDOW`-sized ranges; the last one is open-ended."""
+    bounds = []
+    while start + WINDOW < end:
+        bounds.append((start, start + WINDOW))
+        start += WINDOW
+    bounds.append((start, None))
+    return bounds
 
-if not orders:
+
+class ReminderLog:
+    """Buffer reminder lines and append them to `LOG_FILE` in batches."""
+
+    def __init__(self, f):
+        self.f = f
+        self.lines = []
+        self.count = 0
+
+    def add(self, order):
+        customer = order.get("customer") or {}
+        self.lines.append(f"[{now()}] Order ID: {order.get('id')} Customer: {customer.get('email')}\n")
+        self.count += 1
+        if len(self.lines) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.f.writelines(self.lines)
+        self.lines = []
+
+
+async def fetch_window(session, semaphore, window, after, log):
+    """Page through one window and return the highest `(order_date, id)` seen."""
+    start, end = window
+    variables = {
+        "first": PAGE_SIZE,
+        "after": after,
+        "from": start.isoformat(),
+        "until": end.isoformat() if end else None,
+    }
+    mark = None
+    async with semaphore:
+        while True:
+            result = await session.execute(QUERY, variable_values=variables)
+            connection = result["allOrders"]
+            for edge in connection["edges"]:
+                order = edge["node"]
+                log.add(order)
+                mark = (order["orderDate"], int(order["id"]))
+            if not connection["pageInfo"]["hasNextPage"]:
+                return mark
+            variables["after"] = connection["pageInfo"]["endCursor"]
+
+
+async def process(watermark, log):
+    lookback = datetime.utcnow() - LOOKBACK
+    if watermark and parse_date(watermark[0]) >= lookback:
+        start, after = parse_date(watermark[0]), encode_cursor(watermark)
+    else:
+        start, after = lookback, None
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    transport = AIOHTTPTransport(url=GRAPHQL_ENDPOINT)
+    async with Client(transport=transport, fetch_schema_from_transport=False) as session:
+        # Only the window holding the watermark needs its cursor; the
+        # others start at their own lower bound.
+        results = await asyncio.gather(*(
+            fetch_window(session, semaphore, window, after if i == 0 else None, log)
+            for i, window in enumerate(windows(start, datetime.utcnow()))
+        ), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    marks = [mark for mark in results if mark]
+    return max(marks, key=lambda mark: (parse_date(mark[0]), mark[1])) if marks else None
+
+
+def main():
+    watermark = load_watermark()
     with open(LOG_FILE, "a") as f:
-        f.write(f"[{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}] No orders in the last 7 days.\n")
-    print("Order reminders processed!")
-    sys.exit(0)
+        log = ReminderLog(f)
+        try:
+            mark = asyncio.run(process(watermark, log))
+        except Exception as exc:
+            log.flush()
+            f.write(f"[{now()}] Error querying GraphQL: {exc}\n")
+            print("Error querying GraphQL endpoint. See log for details.")
+            sys.exit(1)
+        log.flush()
+        if not log.count:
+            f.write(f"[{now()}] No new orders since the last run.\n")
 
-with open(LOG_FILE, "a") as f:
-    for order in orders:
-        order_id = order.get("id")
-        customer_email = (order.get("customer") or {}).get("email") if isinstance(order.get("customer"), dict) else None
-        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        f.write(f"[{timestamp}] Order ID: {order_id} Customer: {customer_email}\n")
+    # Only advance once every reminder is written, so a failed run is retried.
+    if mark:
+        save_watermark(mark)
+    print("Order reminders processed!")
 
-print("Order reminders processed!")
 
+if __name__ == "__main__":
+    main()
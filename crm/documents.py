@@ -0,0 +1,150 @@
+"""Parsed-document cache and persisted query registry for the GraphQL view.
+
+Clients send the same handful of operations over and over. `DocumentCache`
+keeps the parsed and validated AST of each distinct query string in a
+bounded LRU, so parse and validate run once per operation rather than once
+per request. `PersistedQueryRegistry` lets clients send only the SHA-256 hash
+of a query (Apollo's automatic persisted queries protocol), looked up among
+queries registered from a file or by earlier requests.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class LRUStore:
+    """A thread-safe, size-bounded mapping with hit and miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class DocumentCache(LRUStore):
+    def get_document(self, schema, query, digest=None):
+        """Return `(document, errors)` for `query` validated against `schema`.
+
+        `document` is None when the query does not parse. Invalid documents are
+        cached along with their errors so repeated bad requests stay cheap.
+        """
+        key = (id(schema), digest or query_hash(query))
+        entry = self.get(key)
+        if entry is None:
+            try:
+                document = parse(query)
+            except GraphQLError as error:
+                entry = (None, [error])
+            else:
+                entry = (document, validate(schema, document))
+            self.set(key, entry)
+        return entry
+
+
+class PersistedQueryNotFound(GraphQLError):
+    def __init__(self):
+        super().__init__("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+
+
+class PersistedQueryRegistry:
+    """Queries addressable by their SHA-256 hash.
+
+    Queries loaded from `CRM_PERSISTED_QUERIES_FILE` are kept for the life of
+    the process. Queries registered by clients through the automatic
+    persisted queries handshake go into a bounded LRU.
+    """
+
+    def __init__(self, maxsize, path=None):
+        self._static = {}
+        self._dynamic = LRUStore(maxsize)
+        if path:
+            self.load(path)
+
+    def load(self, path):
+        """Load a JSON file holding either `{hash: query}` or a list of queries."""
+        with open(path) as f:
+            queries = json.load(f)
+        if isinstance(queries, dict):
+            queries = queries.values()
+        for query in queries:
+            self._static[query_hash(query)] = query
+
+    def register(self, query, digest=None):
+        digest = digest or query_hash(query)
+        if digest not in self._static:
+            self._dynamic.set(digest, query)
+        return digest
+
+    def lookup(self, digest):
+        return self._static.get(digest) or self._dynamic.get(digest)
+
+    def resolve(self, query, extensions):
+        """Return the query text for a request, registering it when new.
+
+        `extensions` is the request's `extensions` object. Raises
+        `PersistedQueryNotFound` for an unknown hash sent without a query, and
+        `GraphQLError` when a query does not match the hash sent with it.
+        """
+        persisted = (extensions or {}).get("persistedQuery")
+        if not isinstance(persisted, dict) or not persisted.get("sha256Hash"):
+            return query
+        digest = persisted["sha256Hash"]
+        if not query:
+            query = self.lookup(digest)
+            if query is None:
+                raise PersistedQueryNotFound()
+            return query
+        if query_hash(query) != digest:
+            raise GraphQLError("provided sha does not match query")
+        self.register(query, digest)
+        return query
+
+
+document_cache = DocumentCache(getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", 1000))
+persisted_queries = PersistedQueryRegistry(
+    getattr(settings, "CRM_PERSISTED_QUERIES_MAX", 10000),
+    getattr(settings, "CRM_PERSISTED_QUERIES_FILE", None),
+)
@@ -0,0 +1,139 @@
+"""Streaming CSV/NDJSON exports of customers and orders.
+
+`GET /export/customers` and `GET /export/orders` accept the query parameters
+of `CustomerFilter` and `OrderFilter` (e.g. `total_amount_min`,
+`order_date_after`, `customer_name`) plus `format=ndjson` (the default) or
+`format=csv`. Rows are read with `.iterator(chunk_size=CRM_EXPORT_CHUNK_SIZE)`
+in primary key order, and the product ids of each chunk of orders are fetched
+in one query, so memory use does not grow with the size of the export. Under
+ASGI the rows are produced in a worker thread and streamed asynchronously.
+Exports read from a replica when `crm.routers` has any.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from crm import routers
+from crm.filters import CustomerFilter, OrderFilter
+from crm.models import Customer, Order, OrderItem
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CUSTOMER_FIELDS = ["id", "name", "email", "phone"]
+ORDER_FIELDS = ["id", "customer_id", "customer_email", "order_date", "total_amount", "product_ids"]
+
+
+def chunk_size():
+    return getattr(settings, "CRM_EXPORT_CHUNK_SIZE", 2000)
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def customer_chunks(queryset, size):
+    return chunks(queryset.order_by("pk").values(*CUSTOMER_FIELDS).iterator(chunk_size=size), size)
+
+
+def order_chunks(queryset, size):
+    rows = (
+        queryset.order_by("pk")
+        .values("id", "customer_id", "order_date", "total_amount", customer_email=F("customer__email"))
+        .iterator(chunk_size=size)
+    )
+    lines = OrderItem.objects.using(queryset.db)
+    for chunk in chunks(rows, size):
+        products = {row["id"]: [] for row in chunk}
+        chunk_lines = (
+            lines.filter(order_id__in=list(products))
+            .order_by("order_id", "product_id")
+            .values_list("order_id", "product_id")
+        )
+        for order_id, product_id in chunk_lines:
+            products[order_id].append(product_id)
+        for row in chunk:
+            row["product_ids"] = products[row["id"]]
+        yield chunk
+
+
+class Echo:
+    """File-like object `csv.writer` writes to, returning each line."""
+
+    def write(self, value):
+        return value
+
+
+def encode(chunks, fields, fmt):
+    """Yield one string of encoded rows per chunk."""
+    if fmt == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for chunk in chunks:
+            yield "".join(
+                writer.writerow([
+                    " ".join(map(str, value)) if isinstance(value, list) else value
+                    for value in (row[field] for field in fields)
+                ])
+                for row in chunk
+            )
+    else:
+        for chunk in chunks:
+            yield "".join(
+                json.dumps({field: row[field] for field in fields}, cls=DjangoJSONEncoder) + "\n"
+                for row in chunk
+            )
+
+
+async def iterate_in_thread(iterator):
+    """Drive a sync iterator that holds a database cursor from one thread."""
+    step = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (item := await step(iterator, done)) is not done:
+            yield item
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+def export(request, model, filterset_class, fields, produce):
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in FORMATS:
+        return JsonResponse({"errors": {"format": [f"Expected one of: {', '.join(FORMATS)}."]}}, status=400)
+    params = request.GET.copy()
+    params.pop("format", None)
+    queryset = model.objects.using(routers.read_database(request))
+    filterset = filterset_class(params, queryset=queryset)
+    if not filterset.is_valid():
+        return JsonResponse({"errors": filterset.errors}, status=400)
+
+    content = encode(produce(filterset.qs, chunk_size()), fields, fmt)
+    if isinstance(request, ASGIRequest):
+        content = iterate_in_thread(content)
+    response = StreamingHttpResponse(content, content_type=FORMATS[fmt])
+    filename = f"{model._meta.verbose_name_plural.replace(' ', '_')}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_GET
+def export_customers(request):
+    return export(request, Customer, CustomerFilter, CUSTOMER_FIELDS, customer_chunks)
+
+
+@require_GET
+def export_orders(request):
+    return export(request, Order, OrderFilter, ORDER_FIELDS, order_chunks)
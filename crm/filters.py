@@ -1,9 +1,11 @@
 import django_filters
-from crm.models import Customer, Product, Order
+from django.db.models import Exists, OuterRef
+from crm.models import Customer, Product, Order, OrderItem
+from crm.search import matching_ids, search
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
-    email = django_filters.CharFilter(field_name='email', lookup_expr='icontains')
+    name = django_filters.CharFilter(method='filter_text')
+    email = django_filters.CharFilter(method='filter_text')
     created_at = django_filters.DateFromToRangeFilter(field_name='created_at')
     phone_pattern = django_filters.CharFilter(field_name='phone', lookup_expr='startswith')
 
@@ -11,8 +13,11 @@ class CustomerFilter(django_filters.FilterSet):
         model = Customer
         fields = ['name', 'email', 'created_at', 'phone']
 
+    def filter_text(self, queryset, name, value):
+        return search(queryset, '', Customer, name, value)
+
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
+    name = django_filters.CharFilter(method='filter_name')
     price = django_filters.RangeFilter(field_name='price')
     stock = django_filters.RangeFilter(field_name='stock')
 
@@ -20,13 +25,41 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = ['name', 'price', 'stock']
 
+    def filter_name(self, queryset, name, value):
+        return search(queryset, '', Product, 'name', value)
+
 class OrderFilter(django_filters.FilterSet):
     total_amount = django_filters.RangeFilter(field_name='total_amount')
     order_date = django_filters.DateFromToRangeFilter(field_name='order_date')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
-    product_id = django_filters.NumberFilter(field_name='products__id')
+    order_date_gte = django_filters.IsoDateTimeFilter(field_name='order_date', lookup_expr='gte')
+    order_date_lt = django_filters.IsoDateTimeFilter(field_name='order_date', lookup_expr='lt')
+    customer_name = django_filters.CharFilter(method='filter_customer_name')
+    product_name = django_filters.CharFilter(method='filter_product_name')
+    product_id = django_filters.NumberFilter(method='filter_product_id')
 
     class Meta:
         model = Order
-        fields = ['total_amount', 'order_date', 'customer_name', 'product_name', 'product_id']
+        fields = [
+            'total_amount', 'order_date', 'order_date_gte', 'order_date_lt',
+            'customer_name', 'product_name', 'product_id',
+        ]
+
+    # Relation filters compile to subqueries rather than joins, so an order
+    # matching several products is returned once and paginated queries need
+    # no DISTINCT. Product filters use correlated EXISTS over the line
+    # items; the customer filter is `customer_id IN (...)`, which can use the
+    # (customer, order_date) index.
+    def filter_customer_name(self, queryset, name, value):
+        return search(queryset, 'customer', Customer, 'name', value)
+
+    def filter_product_name(self, queryset, name, value):
+        ids = matching_ids(Product, 'name', value, using=queryset.db)
+        if ids is None:
+            lines = OrderItem.objects.filter(product__name__icontains=value)
+        else:
+            lines = OrderItem.objects.filter(product_id__in=ids)
+        return queryset.filter(Exists(lines.filter(order_id=OuterRef('pk'))))
+
+    def filter_product_id(self, queryset, name, value):
+        lines = OrderItem.objects.filter(order_id=OuterRef('pk'), product_id=value)
+        return queryset.filter(Exists(lines))
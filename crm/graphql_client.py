@@ -0,0 +1,129 @@
+"""Run GraphQL operations from cron jobs and Celery tasks.
+
+Inside a Django process (`manage.py crontab`, a Celery worker) operations
+execute directly against `alx_backend_graphql.schema.schema`, reusing the
+view's parsed-document cache, so a job neither pays for an HTTP round trip
+to its own project nor fails when the web server is down. Anywhere else they
+are POSTed to `CRM_GRAPHQL_URL` through shared `requests.Session`s, which
+keep connections alive. Queries are retried with backoff on connection
+failures, read errors and 502/503/504 responses; mutations only on
+connection failures, so a retry never applies a mutation twice.
+"""
+
+import os
+from types import SimpleNamespace
+
+DEFAULT_URL = "http://localhost:8000/graphql"
+# (connect, read) timeouts in seconds for the HTTP fallback
+TIMEOUT = (3.05, 30)
+
+# Sessions keyed by whether they send mutations, which get a stricter retry policy
+_sessions = {}
+
+
+class GraphQLClientError(Exception):
+    """The operation returned errors; `errors` holds them in response format."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(str(error.get("message", error)) for error in errors))
+
+
+def in_django():
+    try:
+        from django.apps import apps
+    except ImportError:
+        return False
+    return apps.ready
+
+
+def execute(query, variables=None, operation_name=None):
+    """Run `query` and return its `data`, raising `GraphQLClientError` on errors."""
+    if in_django():
+        return execute_local(query, variables, operation_name)
+    return execute_http(query, variables, operation_name)
+
+
+def execute_local(query, variables=None, operation_name=None):
+    from graphql import execute as graphql_execute
+
+    from alx_backend_graphql.schema import schema
+    from crm.documents import document_cache
+
+    document, errors = document_cache.get_document(schema.graphql_schema, query)
+    if not errors:
+        result = graphql_execute(
+            schema.graphql_schema,
+            document,
+            variable_values=variables,
+            operation_name=operation_name,
+            context_value=SimpleNamespace(),
+        )
+        errors = result.errors
+    if errors:
+        raise GraphQLClientError([error.formatted for error in errors])
+    return result.data
+
+
+def _url():
+    if in_django():
+        from django.conf import settings
+        return getattr(settings, "CRM_GRAPHQL_URL", DEFAULT_URL)
+    return os.environ.get("CRM_GRAPHQL_URL", DEFAULT_URL)
+
+
+def _retry(mutation):
+    from urllib3.util.retry import Retry
+
+    if mutation:
+        # A mutation may have committed before a read timeout or a 5xx, so
+        # only connection failures, where nothing was sent, are retried.
+        return Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.5)
+    return Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=None,
+    )
+
+
+def get_session(mutation=False):
+    """The shared session for queries, or for mutations when `mutation`."""
+    if mutation not in _sessions:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        retry = _retry(mutation)
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=10, max_retries=retry))
+        session.mount("https://", HTTPAdapter(pool_maxsize=10, max_retries=retry))
+        _sessions[mutation] = session
+    return _sessions[mutation]
+
+
+def is_mutation(query, operation_name=None):
+    """Whether `query` runs a mutation; unparsable documents count as one."""
+    from graphql import GraphQLError, OperationType, get_operation_ast, parse
+
+    try:
+        operation = get_operation_ast(parse(query), operation_name)
+    except GraphQLError:
+        return True
+    return operation is None or operation.operation != OperationType.QUERY
+
+
+def execute_http(query, variables=None, operation_name=None):
+    response = get_session(is_mutation(query, operation_name)).post(
+        _url(),
+        json={"query": query, "variables": variables, "operationName": operation_name},
+        timeout=TIMEOUT,
+    )
+    try:
+        payload = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise
+    if payload.get("errors"):
+        raise GraphQLClientError(payload["errors"])
+    response.raise_for_status()
+    return payload.get("data")
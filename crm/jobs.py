@@ -0,0 +1,434 @@
+"""Singleton execution of scheduled jobs.
+
+django-crontab and Celery beat start `log_crm_heartbeat`, `update_low_stock`
+and `generate_crm_report` on fixed schedules, whether or not the previous run
+has finished. A job wrapped with `Job` first takes a lease on its name:
+
+    @jobs.Job("crm.update_low_stock", policy=jobs.COALESCE, timeout=600)
+    def update_low_stock():
+        ...
+
+- while another run holds the lease, a `SKIP` job records a skipped run and
+  returns; a `COALESCE` job asks the holder to run once more when it
+  finishes, so any number of overlapping triggers costs at most one rerun
+- the lease expires `CRM_JOB_LEASE_SECONDS` after it was last renewed, and a
+  background thread renews it while the job runs, so a crashed holder blocks
+  the job for at most that long
+- a run that exceeds its `timeout` is interrupted with `JobTimeout`: by
+  SIGALRM in the main thread (as under django-crontab and Celery's prefork
+  pool), and in other threads (as under `run_scheduler`) at its next Python
+  instruction, so a call blocked in C, such as a slow query, is interrupted
+  only once it returns
+- every trigger is recorded as a `JobRun` with its outcome and duration;
+  each write bumps its response cache version, so `jobRuns` stays current
+
+Leases are kept by the backend named in `CRM_JOB_LOCK_BACKEND`, built with
+`CRM_JOB_LOCK_OPTIONS`: `DatabaseLockBackend` (one `JobLease` row per job,
+the default), `RedisLockBackend`, or `LocalLockBackend`, an in-process
+stand-in for tests and single-process development.
+"""
+
+import ctypes
+import functools
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from crm.models import JobLease, JobRun
+from crm.response_cache import bump_versions
+
+logger = logging.getLogger(__name__)
+
+SKIP = "skip"
+COALESCE = "coalesce"
+
+
+class JobTimeout(BaseException):
+    """Raised inside a job that ran past its timeout.
+
+    Not an `Exception`, so the job's own error handling (and graphql-core's)
+    does not swallow it.
+    """
+
+
+def lease_seconds():
+    return getattr(settings, "CRM_JOB_LEASE_SECONDS", 60)
+
+
+def new_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DatabaseLockBackend:
+    """Leases as `JobLease` rows, changed only by single conditional statements."""
+
+    def acquire(self, name, owner, ttl):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=ttl)
+        taken_over = JobLease.objects.filter(name=name, expires_at__lte=now).update(
+            owner=owner, expires_at=expires_at, rerun=False
+        )
+        if taken_over:
+            return True
+        try:
+            with transaction.atomic():
+                JobLease.objects.create(name=name, owner=owner, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    def renew(self, name, owner, ttl):
+        return bool(JobLease.objects.filter(name=name, owner=owner).update(
+            expires_at=timezone.now() + timedelta(seconds=ttl)
+        ))
+
+    def request_rerun(self, name):
+        return bool(JobLease.objects.filter(name=name, expires_at__gt=timezone.now()).update(rerun=True))
+
+    def release(self, name, owner):
+        leases = JobLease.objects.filter(name=name, owner=owner)
+        while True:
+            if leases.filter(rerun=True).update(rerun=False):
+                return False
+            if leases.filter(rerun=False).delete()[0] or not leases.exists():
+                return True
+
+
+class RedisLockBackend:
+    """Leases as Redis keys set with `NX PX`, changed only by their owner."""
+
+    ACQUIRE = """
+    if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+        redis.call('del', KEYS[2])
+        return 1
+    end
+    return 0
+    """
+    RENEW = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    REQUEST_RERUN = """
+    local ttl = redis.call('pttl', KEYS[1])
+    if ttl > 0 then
+        redis.call('set', KEYS[2], 1, 'PX', ttl)
+        return 1
+    end
+    return 0
+    """
+    RELEASE = """
+    if redis.call('get', KEYS[1]) ~= ARGV[1] then
+        return 1
+    end
+    if redis.call('del', KEYS[2]) == 1 then
+        return 0
+    end
+    redis.call('del', KEYS[1])
+    return 1
+    """
+
+    def __init__(self, url="redis://localhost:6379/2", prefix="crm:job:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(self.ACQUIRE)
+        self._renew = self.client.register_script(self.RENEW)
+        self._request_rerun = self.client.register_script(self.REQUEST_RERUN)
+        self._release = self.client.register_script(self.RELEASE)
+
+    def _keys(self, name):
+        return [self.prefix + name, self.prefix + name + ":rerun"]
+
+    def acquire(self, name, owner, ttl):
+        return bool(self._acquire(keys=self._keys(name), args=[owner, int(ttl * 1000)]))
+
+    def renew(self, name, owner, ttl):
+        return bool(self._renew(keys=self._keys(name), args=[owner, int(ttl * 1000)]))
+
+    def request_rerun(self, name):
+        return bool(self._request_rerun(keys=self._keys(name)))
+
+    def release(self, name, owner):
+        return bool(self._release(keys=self._keys(name), args=[owner]))
+
+
+class LocalLockBackend:
+    """In-process leases; they only exclude runs within this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> [owner, expires (monotonic), rerun]
+        self._leases = {}
+
+    def _live(self, name):
+        lease = self._leases.get(name)
+        return lease if lease is not None and lease[1] > time.monotonic() else None
+
+    def acquire(self, name, owner, ttl):
+        with self._lock:
+            if self._live(name):
+                return False
+            self._leases[name] = [owner, time.monotonic() + ttl, False]
+            return True
+
+    def renew(self, name, owner, ttl):
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease is None or lease[0] != owner:
+                return False
+            lease[1] = time.monotonic() + ttl
+            return True
+
+    def request_rerun(self, name):
+        with self._lock:
+            lease = self._live(name)
+            if lease is None:
+                return False
+            lease[2] = True
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease is None or lease[0] != owner:
+                return True
+            if lease[2]:
+                lease[2] = False
+                return False
+            del self._leases[name]
+            return True
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_class = import_string(getattr(
+                settings, "CRM_JOB_LOCK_BACKEND", "crm.jobs.DatabaseLockBackend"
+            ))
+            _backend = backend_class(**getattr(settings, "CRM_JOB_LOCK_OPTIONS", {}))
+        return _backend
+
+
+class LeaseKeeper(threading.Thread):
+    """Renew a lease every third of its TTL until stopped."""
+
+    def __init__(self, name, owner, ttl):
+        super().__init__(name=f"lease:{name}", daemon=True)
+        self.job_name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.ttl / 3):
+                try:
+                    if not backend().renew(self.job_name, self.owner, self.ttl):
+                        logger.warning("Job %s lost its lease", self.job_name)
+                        return
+                except Exception:
+                    logger.exception("Could not renew the lease of job %s", self.job_name)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _raise_in_thread(thread_id, exc_type):
+    """Make `exc_type` raise in thread `thread_id`; None cancels a pending one."""
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exc_type) if exc_type else None
+    )
+
+
+@contextmanager
+def time_limit(seconds, name):
+    """Raise `JobTimeout` in the block after `seconds`."""
+    if not seconds:
+        yield
+        return
+    if hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread():
+        def expire(signum, frame):
+            raise JobTimeout(f"Job {name} exceeded its {seconds}s timeout")
+
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        return
+
+    # Signals only reach the main thread; raise asynchronously in this one.
+    thread_id = threading.get_ident()
+    lock = threading.Lock()
+    state = {"inside": True, "fired": False}
+
+    def expire():
+        with lock:
+            if state["inside"]:
+                state["fired"] = True
+                _raise_in_thread(thread_id, JobTimeout)
+
+    timer = threading.Timer(seconds, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        with lock:
+            state["inside"] = False
+            timer.cancel()
+            if state["fired"]:
+                # The block may have ended before the exception was raised.
+                _raise_in_thread(thread_id, None)
+
+
+def _elapsed_ms(run):
+    return (timezone.now() - run.started_at).total_seconds() * 1000
+
+
+class Job:
+    """A named job run by at most one process at a time.
+
+    Use it as a decorator, or call `begin` and `end` around work that
+    outlives the call that started it, such as a Celery chord.
+    """
+
+    def __init__(self, name, policy=SKIP, timeout=None):
+        if policy not in (SKIP, COALESCE):
+            raise ValueError(f"Unknown job policy: {policy}")
+        self.name = name
+        self.policy = policy
+        self.timeout = timeout
+
+    def _record(self, status, owner):
+        now = timezone.now()
+        run = JobRun.objects.create(
+            job=self.name, status=status, owner=owner, started_at=now, finished_at=now, duration_ms=0
+        )
+        bump_versions(JobRun)
+        return run
+
+    def begin(self, ttl=None):
+        """Take the lease and record a running `JobRun`; None if it is held.
+
+        The lease lasts `ttl` seconds (default `CRM_JOB_LEASE_SECONDS`) unless
+        renewed.
+        """
+        owner = new_owner()
+        ttl = ttl or lease_seconds()
+        while not backend().acquire(self.name, owner, ttl):
+            if self.policy == SKIP:
+                self._record(JobRun.SKIPPED, owner)
+                return None
+            if backend().request_rerun(self.name):
+                self._record(JobRun.COALESCED, owner)
+                return None
+            # The holder released the lease in between; try to take it again.
+        # Runs still marked running lost their lease without finishing.
+        JobRun.objects.filter(job=self.name, status=JobRun.RUNNING).update(
+            status=JobRun.TIMED_OUT, finished_at=timezone.now(), error="Lease expired before the run finished"
+        )
+        run = JobRun.objects.create(job=self.name, status=JobRun.RUNNING, owner=owner)
+        bump_versions(JobRun)
+        return run
+
+    def end(self, run, status, error=""):
+        """Record how `run` (a `JobRun` or its pk) ended and release the lease.
+
+        Returns True when a coalesced trigger asked for a rerun; the lease is
+        then kept for it. Reruns are dropped when the run did not succeed.
+        A run that already ended, e.g. marked timed out by a later `begin`
+        after its lease expired, keeps its recorded outcome.
+        """
+        if not isinstance(run, JobRun):
+            run = JobRun.objects.get(pk=run)
+        finished_at = timezone.now()
+        duration_ms = (finished_at - run.started_at).total_seconds() * 1000
+        ended = JobRun.objects.filter(pk=run.pk, owner=run.owner, status=JobRun.RUNNING).update(
+            status=status, finished_at=finished_at, duration_ms=duration_ms, error=error
+        )
+        if ended:
+            run.status, run.finished_at, run.duration_ms, run.error = status, finished_at, duration_ms, error
+            bump_versions(JobRun)
+        else:
+            logger.warning("Job %s: run %s had already ended; not recording it as %s", self.name, run.pk, status)
+        released = backend().release(self.name, run.owner)
+        if ended and status == JobRun.SUCCEEDED:
+            return not released
+        while not released:
+            released = backend().release(self.name, run.owner)
+        return False
+
+    def rerun(self, run, ttl=None):
+        """Record a new running `JobRun` under the lease `run` held.
+
+        With `ttl`, the lease is also renewed for that many seconds.
+        """
+        if ttl:
+            backend().renew(self.name, run.owner, ttl)
+        run = JobRun.objects.create(job=self.name, status=JobRun.RUNNING, owner=run.owner)
+        bump_versions(JobRun)
+        return run
+
+    def run(self, func, *args, **kwargs):
+        """Call `func` under the lease, once per trigger it coalesced."""
+        run = self.begin()
+        if run is None:
+            return None
+        keeper = LeaseKeeper(self.name, run.owner, lease_seconds())
+        keeper.start()
+        try:
+            while True:
+                try:
+                    with time_limit(self.timeout, self.name):
+                        result = func(*args, **kwargs)
+                except JobTimeout as exc:
+                    # Raised from another thread, it carries no message.
+                    error = str(exc) or f"Job {self.name} exceeded its {self.timeout}s timeout"
+                    self.end(run, JobRun.TIMED_OUT, error)
+                    raise
+                except Exception as exc:
+                    self.end(run, JobRun.FAILED, repr(exc))
+                    raise
+                status, error = JobRun.SUCCEEDED, ""
+                if self.timeout and _elapsed_ms(run) > self.timeout * 1000:
+                    status = JobRun.TIMED_OUT
+                    error = f"Finished after its {self.timeout}s timeout"
+                    logger.warning("Job %s: %s", self.name, error)
+                if not self.end(run, status, error):
+                    return result
+                run = self.rerun(run)
+        finally:
+            keeper.stop()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func, *args, **kwargs)
+
+        wrapper.job = self
+        return wrapper
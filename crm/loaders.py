@@ -0,0 +1,189 @@
+"""Per-request batch loaders for the relations exposed by `crm.schema`.
+
+A loader resolves a relation for one instance, but fetches it for every peer
+instance that came out of the same queryset evaluation (see
+`crm.querysets.PeerQuerySet`). A page of 100 orders therefore costs one `IN`
+query for the customers and one for the products, instead of one query per
+order and relation. Relations already joined or prefetched by
+`crm.optimizer` are used as they are.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.db.models import F
+
+from crm.models import Customer, Product, Order, OrderItem
+
+LOADERS_ATTR = '_crm_loaders'
+
+
+class RelationLoader:
+    """Batch and cache the lookups of one relation for the current request."""
+
+    #: Attribute name used to memoize the loaded value on each instance.
+    name = None
+    #: Value returned for a key the batch query did not produce.
+    default = None
+
+    def __init__(self):
+        self._cache = {}
+        # Sibling fields may resolve concurrently (see `crm.async_views`);
+        # one of them runs the batch query while the others wait for it.
+        self._lock = threading.Lock()
+
+    def key_for(self, instance):
+        return instance.pk
+
+    def batch_load(self, keys):
+        """Return a dict mapping each key to its loaded value."""
+        raise NotImplementedError
+
+    def cached_on(self, instance):
+        loaded = getattr(instance, '_loaded_relations', None)
+        if loaded is not None and self.name in loaded:
+            return True, loaded[self.name]
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if self.name in prefetched:
+            return True, list(prefetched[self.name])
+        return False, None
+
+    def load(self, instance):
+        hit, value = self.cached_on(instance)
+        if hit:
+            return value
+        key = self.key_for(instance)
+        if key not in self._cache:
+            with self._lock:
+                if key not in self._cache:
+                    self._load_peers(instance, key)
+        value = self._cache.get(key, self.default)
+        self._memoize(instance, value)
+        return value
+
+    def _load_peers(self, instance, key):
+        peers = getattr(instance, '_peers', None) or [instance]
+        keys = {self.key_for(peer) for peer in peers}
+        keys.add(key)
+        missing = [k for k in keys if k is not None and k not in self._cache]
+        loaded = self.batch_load(missing) if missing else {}
+        for k in missing:
+            self._cache[k] = loaded.get(k, self.copy_default())
+        for peer in peers:
+            self._memoize(peer, self._cache.get(self.key_for(peer), self.default))
+
+    def copy_default(self):
+        return list(self.default) if isinstance(self.default, list) else self.default
+
+    def _memoize(self, instance, value):
+        if not hasattr(instance, '_loaded_relations'):
+            instance._loaded_relations = {}
+        instance._loaded_relations[self.name] = value
+
+
+class OrderCustomerLoader(RelationLoader):
+    name = 'customer'
+
+    def key_for(self, instance):
+        return instance.customer_id
+
+    def cached_on(self, instance):
+        if Order.customer.is_cached(instance):
+            return True, instance.customer
+        return super().cached_on(instance)
+
+    def batch_load(self, keys):
+        return Customer.objects.in_bulk(keys)
+
+
+class OrderProductsLoader(RelationLoader):
+    name = 'products'
+    default = []
+
+    def batch_load(self, keys):
+        grouped = defaultdict(list)
+        rows = Product.objects.filter(orders__id__in=keys).annotate(_loader_key=F('orders__id'))
+        for product in rows:
+            grouped[product._loader_key].append(product)
+        return grouped
+
+
+class OrderItemsLoader(RelationLoader):
+    name = 'items'
+    default = []
+
+    def batch_load(self, keys):
+        grouped = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=keys).order_by('pk'):
+            grouped[item.order_id].append(item)
+        return grouped
+
+
+class OrderItemProductLoader(RelationLoader):
+    name = 'product'
+
+    def key_for(self, instance):
+        return instance.product_id
+
+    def cached_on(self, instance):
+        if OrderItem.product.is_cached(instance):
+            return True, instance.product
+        return super().cached_on(instance)
+
+    def batch_load(self, keys):
+        return Product.objects.in_bulk(keys)
+
+
+class CustomerOrdersLoader(RelationLoader):
+    name = 'orders'
+    default = []
+
+    def batch_load(self, keys):
+        grouped = defaultdict(list)
+        for order in Order.objects.filter(customer_id__in=keys):
+            grouped[order.customer_id].append(order)
+        return grouped
+
+
+class ProductOrdersLoader(RelationLoader):
+    name = 'orders'
+    default = []
+
+    def batch_load(self, keys):
+        grouped = defaultdict(list)
+        rows = Order.objects.filter(products__id__in=keys).annotate(_loader_key=F('products__id'))
+        for order in rows:
+            grouped[order._loader_key].append(order)
+        return grouped
+
+
+class Loaders:
+    """The set of loaders shared by every resolver of one GraphQL request."""
+
+    def __init__(self):
+        self.order_customer = OrderCustomerLoader()
+        self.order_products = OrderProductsLoader()
+        self.order_items = OrderItemsLoader()
+        self.order_item_product = OrderItemProductLoader()
+        self.customer_orders = CustomerOrdersLoader()
+        self.product_orders = ProductOrdersLoader()
+
+
+def get_loaders(info):
+    """Return the loaders bound to the request behind `info`.
+
+    The loaders live on the execution context (the Django request under
+    `GraphQLView`, or a dict when executing the schema directly). Without a
+    context every call gets fresh loaders; batching across peers still works
+    because loaded values are memoized on the instances themselves.
+    """
+    context = info.context
+    if context is None:
+        return Loaders()
+    if isinstance(context, dict):
+        return context.setdefault(LOADERS_ATTR, Loaders())
+    loaders = getattr(context, LOADERS_ATTR, None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, LOADERS_ATTR, loaders)
+    return loaders
@@ -0,0 +1,170 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from crm.graphql_client import GraphQLClientError, execute_local
+from crm.models import Customer, Product
+
+ALL_ORDERS = """
+query AllOrders($first: Int!) {
+  allOrders(first: $first) {
+    edges { node { id totalAmount orderDate customer { name email } products { name price } } }
+  }
+}
+"""
+
+SEARCH_CUSTOMERS = """
+query SearchCustomers($name: String, $email: String) {
+  allCustomers(first: 20, name: $name, email: $email) { edges { node { id name email } } }
+}
+"""
+
+SEARCH_ORDERS = """
+query SearchOrders($customerName: String, $productName: String) {
+  allOrders(first: 20, customerName: $customerName, productName: $productName) {
+    edges { node { id totalAmount customer { name } } }
+  }
+}
+"""
+
+CREATE_ORDER = """
+mutation CreateOrder($input: OrderInput!) {
+  createOrder(input: $input) { success errors order { id totalAmount } }
+}
+"""
+
+BULK_CREATE_CUSTOMERS = """
+mutation BulkCreateCustomers($input: [CustomerInput!]!) {
+  bulkCreateCustomers(input: $input) { customers { id } errors }
+}
+"""
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted `samples`."""
+    return samples[max(math.ceil(fraction * len(samples)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run representative GraphQL operations in-process and report throughput, "
+        "p50/p95/p99 latency and SQL queries per operation. Mutations are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--operation", action="append", dest="operations",
+                            help="Only run this operation (repeatable).")
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--bulk-size", type=int, default=100)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", help="Compare against results saved with --output.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Fail when p95 grows by more than this fraction over the baseline.")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["warmup"] < 0:
+            raise CommandError("--iterations must be positive and --warmup non-negative.")
+        operations = self.operations(options)
+        selected = options["operations"] or list(operations)
+        unknown = set(selected) - set(operations)
+        if unknown:
+            raise CommandError(f"Unknown operation(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        for name in selected:
+            query, variables, mutates = operations[name]
+            results[name] = self.measure(query, variables, mutates, options["iterations"], options["warmup"])
+            self.report(name, results[name])
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["tolerance"])
+
+    def operations(self, options):
+        customer = Customer.objects.order_by("pk").only("name").first()
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:3])
+        if customer is None or not product_ids:
+            raise CommandError("Seed the database first, e.g. `python seed_db.py`.")
+        term = customer.name.split()[0]
+        bulk_size = options["bulk_size"]
+
+        def bulk_customers(i):
+            return {"input": [
+                {"name": f"Bench {i} {n}", "email": f"bench.{i}.{n}@example.invalid"}
+                for n in range(bulk_size)
+            ]}
+
+        # name -> (query, variables for iteration i, mutates)
+        return {
+            "all_orders_nested": (ALL_ORDERS, lambda i: {"first": options["page_size"]}, False),
+            "search_customers": (SEARCH_CUSTOMERS, lambda i: {"name": term}, False),
+            "search_orders": (SEARCH_ORDERS, lambda i: {"customerName": term, "productName": "Pro"}, False),
+            "create_order": (
+                CREATE_ORDER,
+                lambda i: {"input": {"customerId": customer.pk, "productIds": product_ids}},
+                True,
+            ),
+            "bulk_create_customers": (BULK_CREATE_CUSTOMERS, bulk_customers, True),
+        }
+
+    def measure(self, query, variables, mutates, iterations, warmup):
+        timings = []
+        queries = []
+        for i in range(warmup + iterations):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    try:
+                        execute_local(query, variables(i))
+                    except GraphQLClientError as exc:
+                        raise CommandError(f"Operation failed: {exc}")
+                    elapsed = time.perf_counter() - started
+                if mutates:
+                    transaction.set_rollback(True)
+            if i >= warmup:
+                timings.append(elapsed)
+                queries.append(len(captured.captured_queries))
+        timings.sort()
+        return {
+            "iterations": iterations,
+            "throughput": iterations / sum(timings) if sum(timings) else 0,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+            "queries": sum(queries) / len(queries),
+            "max_queries": max(queries),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:24} {result['throughput']:8.1f} ops/s  "
+            f"p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms  "
+            f"{result['queries']:.1f} queries"
+        )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        self.stdout.write(f"\nCompared with {path}:")
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f"{name:24} (not in baseline)")
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0
+            queries = result["queries"] - before["queries"]
+            self.stdout.write(f"{name:24} p95 {change:+.1%}  queries {queries:+.1f}")
+            if change > tolerance or queries > 0:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
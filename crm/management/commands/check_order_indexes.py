@@ -0,0 +1,85 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from crm.filters import OrderFilter
+from crm.models import Order
+
+# Filter name -> (OrderFilter data, indexes any one of which must appear in the plan)
+FILTERS = {
+    'order_date': ({'order_date_after': '2000-01-01'}, ('crm_order_date_idx', 'crm_order_cust_date_idx')),
+    'total_amount': ({'total_amount_min': '100'}, ('crm_order_total_idx',)),
+    'customer_name': ({'customer_name': 'smith'}, ('crm_order_cust_date_idx',)),
+    'product_name': ({'product_name': 'laptop'}, ('crm_order_products',)),
+    'product_id': ({'product_id': '1'}, ('crm_order_products',)),
+}
+
+# Filters served by an index on crm_order itself. The planner drives the
+# query from one of them, so a combination needs only one to show up.
+OUTER_INDEXED = {'order_date', 'total_amount', 'customer_name'}
+
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! VIRTUAL TABLE)(?!.*\bUSING\b)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every combination of the indexed OrderFilter filters and fail "
+        "if a plan scans a table its filters should reach through an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--show", action="store_true", help="Print every plan.")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        full_scan = FULL_SCAN.get(connection.vendor)
+        if full_scan is None:
+            raise CommandError(f"Plans for {connection.vendor} are not supported.")
+
+        failures = []
+        with transaction.atomic(using=connection.alias):
+            if connection.vendor == 'postgresql':
+                # Tiny tables are cheaper to scan; only ask whether an index can be used.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for size in range(1, len(FILTERS) + 1):
+                for names in itertools.combinations(FILTERS, size):
+                    problems, plan = self.check_combination(names, connection, full_scan)
+                    label = ', '.join(names)
+                    if options["show"]:
+                        self.stdout.write(f"-- {label}\n{plan}\n")
+                    if problems:
+                        failures.append(f"{label}: {'; '.join(problems)}")
+
+        for failure in failures:
+            self.stderr.write(failure)
+        if failures:
+            raise CommandError(f"{len(failures)} filter combination(s) are not index-backed.")
+        self.stdout.write(self.style.SUCCESS("Every OrderFilter combination uses its indexes."))
+
+    def check_combination(self, names, connection, full_scan):
+        data = {}
+        for name in names:
+            data.update(FILTERS[name][0])
+        queryset = OrderFilter(data, queryset=Order.objects.using(connection.alias)).qs
+        plan = queryset.explain()
+
+        problems = []
+        outer = [name for name in names if name in OUTER_INDEXED]
+        groups = [name for name in names if name not in OUTER_INDEXED]
+        groups = [[name] for name in groups] + ([outer] if outer else [])
+        for group in groups:
+            indexes = [index for name in group for index in FILTERS[name][1]]
+            if not any(index in plan for index in indexes):
+                problems.append(f"{', '.join(group)} uses none of {', '.join(indexes)}")
+        allowed = set() if outer else {Order._meta.db_table}
+        for table in full_scan.findall(plan):
+            if table not in allowed:
+                problems.append(f"full scan of {table}")
+        return problems, plan
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm import changes
+from crm.models import ChangeLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete change log entries older than --days that every consumer has "
+        "checkpointed past, and with --compact, such entries older than "
+        "--compact-days that a later entry for the same object supersedes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "CRM_CHANGES_RETENTION_DAYS", 30))
+        parser.add_argument("--compact", action="store_true",
+                            help="Keep only the latest entries per object.")
+        parser.add_argument("--compact-days", type=int,
+                            default=getattr(settings, "CRM_CHANGES_COMPACT_DAYS", 1),
+                            help="Only compact entries older than this many days.")
+        parser.add_argument("--ignore-checkpoints", action="store_true",
+                            help="Delete old entries even if a consumer has not read them.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["compact_days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days and --compact-days must be non-negative and --batch-size positive.")
+
+        acknowledged = changes.acknowledged_seq()
+
+        def deletable(queryset, days):
+            queryset = queryset.filter(created_at__lt=timezone.now() - timedelta(days=days))
+            if acknowledged is not None and not options["ignore_checkpoints"]:
+                queryset = queryset.filter(seq__lte=acknowledged)
+            return queryset
+
+        targets = [("expired", deletable(ChangeLog.objects.all(), options["days"]))]
+        if options["compact"]:
+            targets.append(("superseded", deletable(changes.superseded(), options["compact_days"])))
+
+        for label, queryset in targets:
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {queryset.count()} {label} entries.")
+            else:
+                deleted = changes.delete_in_batches(queryset, options["batch_size"])
+                self.stdout.write(f"Deleted {deleted} {label} entries.")
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily, per-customer and per-product revenue rollups from orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--to", dest="date_to", help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options["date_from"]) if options["date_from"] else None
+            date_to = date.fromisoformat(options["date_to"]) if options["date_to"] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        counts = rollups.rebuild(date_from, date_to, batch_size=options["batch_size"])
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
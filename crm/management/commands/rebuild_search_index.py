@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from crm import search
+
+
+class Command(BaseCommand):
+    help = "Create any missing customer/product search indexes and repopulate them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f"Search indexes rebuilt ({connection.vendor})."))
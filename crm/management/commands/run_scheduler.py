@@ -0,0 +1,105 @@
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the CRONJOBS and CELERY_BEAT_SCHEDULE entries from one resident "
+        "process instead of booting Django for every cron tick. Job timeouts "
+        "interrupt a job at its next Python instruction, so a call blocked in "
+        "C (a slow query, a socket read) keeps its worker until it returns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Threads running cron jobs.")
+        parser.add_argument("--jitter", type=float, default=10,
+                            help="Largest per-entry delay, in seconds, added to due times.")
+        parser.add_argument("--catch-up", type=float, default=300,
+                            help="Run an entry once if it missed a due time by at most this many seconds.")
+        parser.add_argument("--state", default="/tmp/crm_scheduler_state.json",
+                            help="File keeping the last due time of each entry across restarts.")
+        parser.add_argument("--no-probe", action="store_true",
+                            help="Do not measure what booting Django for each cron job would cost.")
+        parser.add_argument("--duration", type=float,
+                            help="Stop after this many seconds.")
+        parser.add_argument("--list", action="store_true",
+                            help="Print the entries and their next due times, then exit.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["jitter"] < 0 or options["catch_up"] < 0:
+            raise CommandError("--workers must be positive, --jitter and --catch-up non-negative.")
+        started = time.perf_counter()
+        try:
+            entries = scheduler.build_entries(*scheduler.schedule_settings(), jitter=options["jitter"])
+        except (ImportError, ValueError) as exc:
+            raise CommandError(exc)
+        if not entries:
+            raise CommandError("No CRONJOBS or CELERY_BEAT_SCHEDULE entries to run.")
+
+        runner = scheduler.Scheduler(
+            entries, workers=options["workers"], catch_up=options["catch_up"], state_file=options["state"]
+        )
+        if options["list"]:
+            runner.start(datetime.now(timezone.utc))
+            for entry in entries:
+                self.stdout.write(f"{entry.name}  [{entry.schedule}]  next run {entry.due.isoformat()}")
+            return
+
+        uptime = scheduler.process_uptime()
+        self.stdout.write(
+            f"Scheduler ready with {len(entries)} entries: set up in {(time.perf_counter() - started) * 1000:.1f}ms"
+            + (f", {uptime:.2f}s after the process started" if uptime is not None else "")
+        )
+        if not options["no_probe"]:
+            threading.Thread(target=self.probe, args=(entries,), daemon=True).start()
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: runner.stop())
+        until = time.monotonic() + options["duration"] if options["duration"] is not None else None
+        try:
+            runner.run(until)
+        except KeyboardInterrupt:
+            runner.stop()
+        finally:
+            self.report(entries)
+
+    def probe(self, entries):
+        """Time a cold boot for each cron entry, as django-crontab pays on every tick."""
+        costs = {}
+        for entry in entries:
+            if entry.path is None:
+                continue
+            try:
+                if entry.path not in costs:
+                    costs[entry.path] = scheduler.measure_boot(entry.path)
+            except Exception as exc:
+                self.stderr.write(f"Could not measure the boot cost of {entry.path}: {exc}")
+                return
+            entry.boot_cost = costs[entry.path]
+            self.stdout.write(f"{entry.name}: a per-tick boot takes {entry.boot_cost:.2f}s before the job runs")
+
+    def report(self, entries):
+        saved = 0.0
+        for entry in entries:
+            line = (
+                f"{entry.name}: {entry.runs} runs, {entry.failures} failed, "
+                f"{entry.missed} missed, {entry.overlapped} overlapping skipped"
+            )
+            if entry.runs:
+                latency = entry.latency / entry.runs
+                line += (
+                    f"; started {latency * 1000:.1f}ms after due, "
+                    f"ran in {entry.duration / entry.runs * 1000:.1f}ms on average"
+                )
+                if entry.boot_cost is not None:
+                    saved += entry.boot_cost * entry.runs
+                    line += f"; saved {entry.boot_cost * 1000:.0f}ms of boot per run"
+            self.stdout.write(line)
+        if saved:
+            self.stdout.write(f"Saved {saved:.2f}s of Django boots in total.")
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from crm.routers import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over the SQLite files configured as "
+        "read replicas. Stands in for replication in local development."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        aliases = replicas()
+        if not aliases:
+            raise CommandError("No read replicas are configured (CRM_READ_REPLICAS).")
+        if any(connections[alias].vendor != "sqlite" for alias in [DEFAULT_DB_ALIAS, *aliases]):
+            raise CommandError("sync_replicas only copies SQLite files; use database replication instead.")
+
+        primary.ensure_connection()
+        for alias in aliases:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"Copied {DEFAULT_DB_ALIAS} to {alias}.")
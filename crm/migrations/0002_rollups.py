@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-17 20:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductDailyRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='crm.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerDailyRevenue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='crm.customer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productdailyrevenue',
+            index=models.Index(fields=['day'], name='crm_prod_rev_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productdailyrevenue',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='crm_product_daily_revenue_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='customerdailyrevenue',
+            index=models.Index(fields=['day'], name='crm_cust_rev_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='customerdailyrevenue',
+            constraint=models.UniqueConstraint(fields=('customer', 'day'), name='crm_customer_daily_revenue_uniq'),
+        ),
+    ]
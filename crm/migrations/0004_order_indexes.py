@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='crm_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'order_date'], name='crm_order_cust_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ),
+        # The auto-created through table is only unique on (order_id, product_id);
+        # product-to-order lookups need the reverse order to stay index-only.
+        migrations.RunSQL(
+            'CREATE INDEX crm_order_products_rev_idx ON crm_order_products (product_id, order_id)',
+            'DROP INDEX crm_order_products_rev_idx',
+        ),
+    ]
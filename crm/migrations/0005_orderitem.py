@@ -0,0 +1,68 @@
+# Generated by Django 4.2 on 2026-10-18 02:40
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def snapshot_prices(apps, schema_editor):
+    # Existing rows never recorded a price; the current catalog price is the
+    # best snapshot available.
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    Product = apps.get_model('crm', 'Product')
+    price = Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]
+    OrderItem.objects.using(schema_editor.connection.alias).update(unit_price=Subquery(price))
+    OrderItem.objects.using(schema_editor.connection.alias).update(line_total=F('unit_price') * F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_order_indexes'),
+    ]
+
+    operations = [
+        # Adopt the auto-created through table (and the reverse index 0004
+        # added to it with raw SQL) as the OrderItem model, without touching
+        # the database.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderItem',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+                    ],
+                    options={
+                        'db_table': 'crm_order_products',
+                        'unique_together': {('order', 'product')},
+                        'indexes': [models.Index(fields=['product', 'order'], name='crm_order_products_rev_idx')],
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='products',
+                    field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+            preserve_default=False,
+        ),
+        migrations.RunPython(snapshot_prices, migrations.RunPython.noop),
+    ]
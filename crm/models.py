@@ -1,26 +1,178 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.utils import timezone
 
-class Customer(models.Model):
+from crm.querysets import PeerManager
+
+class ChangeTrackedModel(models.Model):
+    """Saves in a transaction, so the `ChangeLog` entry written by
+    `crm.signals` commits or rolls back together with the row."""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+class Customer(ChangeTrackedModel):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=15, blank=True, null=True)
 
+    objects = PeerManager()
+
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(ChangeTrackedModel):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    objects = PeerManager()
+
     def __str__(self):
         return self.name
 
-class Order(models.Model):
+class Order(ChangeTrackedModel):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    objects = PeerManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date'], name='crm_order_date_idx'),
+            models.Index(fields=['customer', 'order_date'], name='crm_order_cust_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} for {self.customer.name}"
+
+class OrderItem(models.Model):
+    """A product on an order, priced as it was when the order was placed."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    objects = PeerManager()
+
+    class Meta:
+        # The table of the former auto-created many-to-many through model.
+        db_table = 'crm_order_products'
+        unique_together = [('order', 'product')]
+        indexes = [models.Index(fields=['product', 'order'], name='crm_order_products_rev_idx')]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} on order #{self.order_id}"
+
+class DailyRevenue(models.Model):
+    """Orders and revenue per day, maintained by `crm.rollups`."""
+    day = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+class CustomerDailyRevenue(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_revenue')
+    day = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'day'], name='crm_customer_daily_revenue_uniq'),
+        ]
+        indexes = [models.Index(fields=['day'], name='crm_cust_rev_day_idx')]
+
+class ProductDailyRevenue(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_revenue')
+    day = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='crm_product_daily_revenue_uniq'),
+        ]
+        indexes = [models.Index(fields=['day'], name='crm_prod_rev_day_idx')]
+
+class ChangeLog(models.Model):
+    """One insert, update or delete of a customer, product or order.
+
+    Written by `crm.changes` in the transaction that made the change; `seq`
+    orders entries by commit.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = [(CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    # Column values after the change (before it, for deletes); None when the
+    # change was a set-based update whose new values were not read back.
+    payload = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'seq'], name='crm_changelog_object_idx'),
+            models.Index(fields=['created_at'], name='crm_changelog_created_idx'),
+        ]
+
+class ConsumerCheckpoint(models.Model):
+    """The last `ChangeLog.seq` a named consumer has processed."""
+    consumer = models.CharField(max_length=100, unique=True)
+    seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class JobLease(models.Model):
+    """The singleton lease on a scheduled job, held by `owner` until `expires_at`.
+
+    Kept by `crm.jobs.DatabaseLockBackend`; `rerun` asks the holder to run the
+    job once more before releasing it.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+    rerun = models.BooleanField(default=False)
+
+class JobRun(models.Model):
+    """One trigger of a scheduled job and its outcome, written by `crm.jobs`."""
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed_out'
+    SKIPPED = 'skipped'
+    COALESCED = 'coalesced'
+    STATUSES = [
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (TIMED_OUT, 'Timed out'),
+        # Not run because another run held the lease
+        (SKIPPED, 'Skipped'),
+        # Folded into a rerun by the run holding the lease
+        (COALESCED, 'Coalesced'),
+    ]
+
+    job = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUSES)
+    owner = models.CharField(max_length=100)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True)
+    duration_ms = models.FloatField(null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['job', 'started_at'], name='crm_jobrun_job_idx')]
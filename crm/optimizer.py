@@ -0,0 +1,132 @@
+"""Selection-set-aware query planning for the `crm.schema` list resolvers.
+
+`optimize_queryset` walks the fields requested under the current resolver
+(following `edges { node }` of connections, fragments and inline fragments)
+and shapes the queryset to match: `only()` for the selected columns,
+`select_related()` for forward foreign keys and `Prefetch()` objects, planned
+recursively, for many-to-many and reverse relations.
+"""
+
+import graphene
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def collect_selections(selection_sets, fragments):
+    """Merge `selection_sets` into a dict of field name to sub-selection sets."""
+    fields = {}
+    pending = list(selection_sets)
+    while pending:
+        selection_set = pending.pop()
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection.selection_set)
+            elif isinstance(selection, InlineFragmentNode):
+                pending.append(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    pending.append(fragment.selection_set)
+    return fields
+
+
+def unwrap_type(field_type):
+    while True:
+        if isinstance(field_type, graphene.Dynamic):
+            field_type = field_type.get_type()
+        elif isinstance(field_type, graphene.Field):
+            field_type = field_type.type
+        elif callable(field_type) and not isinstance(field_type, type):
+            field_type = field_type()
+        elif hasattr(field_type, 'of_type'):
+            field_type = field_type.of_type
+        else:
+            return field_type
+
+
+def node_selections(graphene_type, selections, fragments):
+    """Descend through `edges { node }` when `graphene_type` is a connection."""
+    if isinstance(graphene_type, type) and issubclass(graphene_type, graphene.relay.Connection):
+        edges = collect_selections(selections.get('edges', []), fragments)
+        return graphene_type._meta.node, collect_selections(edges.get('node', []), fragments)
+    return graphene_type, selections
+
+
+class QueryPlan:
+    """Columns, joins and prefetches needed for one model in a selection."""
+
+    def __init__(self, model, graphene_type, selections, fragments, prefix=''):
+        self.only = [prefix + model._meta.pk.name]
+        self.select_related = []
+        self.prefetches = []
+        self._plan(model, graphene_type, selections, fragments, prefix)
+
+    def _plan(self, model, graphene_type, selections, fragments, prefix):
+        type_fields = getattr(graphene_type._meta, 'fields', {})
+        for name, sub_selections in selections.items():
+            name = to_snake_case(name)
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            path = prefix + name
+            if not field.is_relation:
+                self.only.append(path)
+                continue
+            related_type = graphene_type
+            if name in type_fields:
+                related_type = unwrap_type(type_fields[name])
+            related_type, nested = node_selections(
+                related_type, collect_selections(sub_selections, fragments), fragments
+            )
+            if not hasattr(related_type, '_meta') or not getattr(related_type._meta, 'model', None):
+                continue
+            if field.many_to_one or field.one_to_one:
+                self.only.append(path)
+                self.select_related.append(path)
+                self._plan(field.related_model, related_type, nested, fragments, path + '__')
+            else:
+                self.prefetches.append(
+                    Prefetch(path, queryset=plan_queryset(
+                        field.related_model._default_manager.all(), related_type, nested, fragments,
+                        extra_only=self._reverse_key(field),
+                    ))
+                )
+
+    @staticmethod
+    def _reverse_key(field):
+        # Reverse foreign keys are matched back to their parent through the FK
+        # column, so it has to survive `only()` on the prefetched queryset.
+        if field.one_to_many:
+            return [field.field.name]
+        return []
+
+    def apply(self, queryset):
+        queryset = queryset.only(*self.only)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*self.prefetches)
+        return queryset
+
+
+def plan_queryset(queryset, graphene_type, selections, fragments, extra_only=()):
+    plan = QueryPlan(queryset.model, graphene_type, selections, fragments)
+    plan.only.extend(extra_only)
+    return plan.apply(queryset)
+
+
+def optimize_queryset(queryset, info):
+    """Restrict `queryset` to what the current resolver's selection needs."""
+    graphene_type = unwrap_type(info.return_type).graphene_type
+    selections = collect_selections(
+        [node.selection_set for node in info.field_nodes], info.fragments
+    )
+    graphene_type, selections = node_selections(graphene_type, selections, info.fragments)
+    if getattr(getattr(graphene_type, '_meta', None), 'model', None) is not queryset.model:
+        return queryset
+    return plan_queryset(queryset, graphene_type, selections, info.fragments)
@@ -0,0 +1,197 @@
+"""Order placement shared by `CreateOrder` and `BulkCreateOrders`.
+
+All referenced customers and products are fetched once per call, each line
+item records its quantity and the unit price at the time of the order, totals
+are computed as Decimals from those lines, and stock is reserved with conditional
+`UPDATE ... SET stock = stock - n WHERE stock >= n` statements so concurrent
+checkouts can never drive a product below zero. The revenue rollups and the
+`crm.changes` feed are updated in the same transaction.
+"""
+
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from crm import changes
+from crm.models import ChangeLog, Customer, Product, Order, OrderItem
+from crm.querysets import link_peers
+from crm.response_cache import bump_versions
+from crm.rollups import record_orders
+
+CENTS = Decimal("0.01")
+
+
+class StockConflict(Exception):
+    """Raised when stock allocated under lock could not be written back."""
+
+
+def parse_order_date(value):
+    if value:
+        try:
+            return timezone.datetime.fromisoformat(value)
+        except Exception:
+            pass
+    return timezone.now()
+
+
+def reserve_stock(demand):
+    """Take `demand` ({product_id: quantity}) out of `Product.stock`.
+
+    Must run inside a transaction. Returns the product ids whose stock could
+    not cover the requested quantity; nothing is reserved for those.
+    """
+    short = set()
+    for product_id in sorted(demand):
+        quantity = demand[product_id]
+        updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+        if not updated:
+            short.add(product_id)
+    return short
+
+
+def release_stock(demand):
+    for product_id in sorted(demand):
+        if demand[product_id]:
+            Product.objects.filter(pk=product_id).update(stock=F("stock") + demand[product_id])
+
+
+def restock_low_products(threshold, increment, batch_size, keep=100):
+    """Add `increment` to the stock of every product with `stock < threshold`.
+
+    Products are raised with set-based `UPDATE ... SET stock = stock + n`
+    statements over keyset batches of at most `batch_size` rows, each in its
+    own short transaction, so order placement is never held behind a scan of
+    the whole catalog. Returns the number of restocked products and the ids
+    of the first `keep` of them.
+    """
+    count = 0
+    restocked = []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Product.objects.select_for_update()
+                .filter(pk__gt=last_pk, stock__lt=threshold)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            Product.objects.filter(pk__in=ids).update(stock=F("stock") + increment)
+            changes.record_many(Product, ids, ChangeLog.UPDATE)
+        count += len(ids)
+        restocked.extend(ids[:keep - len(restocked)])
+        last_pk = ids[-1]
+    if count:
+        bump_versions(Product)
+    return count, restocked
+
+
+def place_orders(entries):
+    """Validate and create the orders described by `entries`.
+
+    `entries` is a list of `OrderInput`-shaped dicts. A product id repeated in
+    `product_ids` orders that product more than once. Returns
+    `(orders, errors)` where `orders` maps each accepted input index to its
+    saved `Order` and `errors` maps rejected indexes to their messages.
+    """
+    errors = {}
+    customer_ids = {entry["customer_id"] for entry in entries}
+    product_ids = {pid for entry in entries for pid in entry["product_ids"]}
+    known_customers = set(
+        Customer.objects.filter(id__in=customer_ids).values_list("id", flat=True)
+    )
+    products = Product.objects.only("id", "price").in_bulk(product_ids)
+
+    quantities = {}
+    for idx, entry in enumerate(entries):
+        if entry["customer_id"] not in known_customers:
+            errors[idx] = ["Invalid customer ID."]
+            continue
+        err = []
+        if any(pid not in products for pid in entry["product_ids"]):
+            err.append("One or more product IDs are invalid.")
+        if not entry["product_ids"]:
+            err.append("At least one product must be selected.")
+        if err:
+            errors[idx] = err
+            continue
+        quantities[idx] = Counter(entry["product_ids"])
+
+    orders = {}
+    items = {}
+    with transaction.atomic():
+        accepted = _allocate_stock(quantities, errors)
+        for idx in accepted:
+            items[idx] = [
+                OrderItem(
+                    product_id=pid,
+                    quantity=qty,
+                    unit_price=products[pid].price,
+                    line_total=(products[pid].price * qty).quantize(CENTS),
+                )
+                for pid, qty in quantities[idx].items()
+            ]
+            orders[idx] = Order(
+                customer_id=entries[idx]["customer_id"],
+                order_date=parse_order_date(entries[idx].get("order_date")),
+                total_amount=sum((item.line_total for item in items[idx]), Decimal("0")),
+            )
+        link_peers(Order.objects.bulk_create(orders.values()))
+        for idx in accepted:
+            for item in items[idx]:
+                item.order = orders[idx]
+        OrderItem.objects.bulk_create([item for idx in accepted for item in items[idx]])
+        record_orders((orders[idx], items[idx]) for idx in accepted)
+        changes.record_instances(orders.values(), ChangeLog.CREATE)
+        # Stock was changed with set-based updates, so these entries carry no payload.
+        changes.record_many(
+            Product, sorted({pid for idx in accepted for pid in quantities[idx]}), ChangeLog.UPDATE
+        )
+        if accepted:
+            bump_versions(Order, Product)
+    return orders, errors
+
+
+def _allocate_stock(quantities, errors):
+    """Reserve stock for `quantities` ({index: Counter}), rejecting into `errors`.
+
+    Products whose combined demand fits are reserved with one conditional
+    update each. For the rest, the remaining stock is locked and handed out to
+    orders in input order; orders that cannot be filled are rejected and
+    whatever they held is given back.
+    """
+    demand = Counter()
+    for counts in quantities.values():
+        demand.update(counts)
+    short = reserve_stock(demand)
+    if not short:
+        return list(quantities)
+
+    remaining = dict(
+        Product.objects.select_for_update().filter(pk__in=short).values_list("id", "stock")
+    )
+    allocated = Counter()
+    released = Counter()
+    accepted = []
+    for idx, counts in quantities.items():
+        if all(remaining[pid] >= qty for pid, qty in counts.items() if pid in short):
+            for pid, qty in counts.items():
+                if pid in short:
+                    remaining[pid] -= qty
+                    allocated[pid] += qty
+            accepted.append(idx)
+            continue
+        missing = sorted(pid for pid, qty in counts.items() if pid in short and remaining[pid] < qty)
+        errors[idx] = [f"Insufficient stock for product IDs: {', '.join(map(str, missing))}."]
+        released.update({pid: qty for pid, qty in counts.items() if pid not in short})
+
+    release_stock(released)
+    if reserve_stock(allocated):
+        raise StockConflict("Stock changed while the order batch was being placed.")
+    return accepted
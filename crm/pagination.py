@@ -0,0 +1,148 @@
+"""Connection classes for the `crm.schema` list fields.
+
+`KeysetConnectionField` adds a `keyset: true` mode to
+`DjangoFilterConnectionField`. Instead of `OFFSET` slicing it orders by a
+unique sort key and seeks past the `after` cursor, so every page costs the
+same regardless of depth and concurrent inserts never shift rows between
+pages. Keyset pages never run `COUNT(*)`; `totalCount` is computed only when
+it is selected.
+"""
+
+from functools import partial
+
+import graphene
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+
+from crm.cursors import decode_cursor, encode_cursor
+
+
+class CountableConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        if getattr(root, "length", None) is not None:
+            return root.length
+        return root.iterable.count()
+
+
+def keyset_filter(model, fields, values):
+    """Build `(f1, f2, ...) > (v1, v2, ...)` as a chain of ORed prefixes."""
+    if len(values) != len(fields):
+        raise GraphQLError("Cursor does not match this connection.")
+    try:
+        values = [model._meta.get_field(f).to_python(v) for f, v in zip(fields, values)]
+    except Exception:
+        raise GraphQLError("Cursor does not match this connection.")
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = {fields[j]: values[j] for j in range(i)}
+        condition |= Q(**equal, **{f"{field}__gt": values[i]})
+    return condition
+
+
+def load_fields(queryset, fields):
+    """Keep `fields` loaded through any `only()` or `defer()` on `queryset`."""
+    names, deferred = queryset.query.deferred_loading
+    if not names:
+        return queryset
+    if deferred:
+        return queryset.defer(None).defer(*(names - set(fields)))
+    return queryset.only(*names, *fields)
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    def __init__(self, type_, *args, keyset_fields=("id",), **kwargs):
+        self.keyset_fields = tuple(keyset_fields)
+        kwargs.setdefault("keyset", graphene.Boolean(
+            description=f"Seek by ({', '.join(self.keyset_fields)}) instead of offset slicing."
+        ))
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def keyset_resolver(
+        cls,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        keyset_fields,
+        root,
+        info,
+        **args
+    ):
+        if args.get("last") or args.get("before") or args.get("offset"):
+            raise GraphQLError("Keyset pagination only supports `first` and `after`.")
+        if args.get("first") is not None and args["first"] < 0:
+            raise GraphQLError("Argument 'first' must be a non-negative integer.")
+        first = args.get("first") or max_limit
+        if max_limit and first > max_limit:
+            raise GraphQLError(
+                f"Requesting {first} records on the `{info.field_name}` connection "
+                f"exceeds the `first` limit of {max_limit} records."
+            )
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = maybe_queryset(queryset_resolver(connection, iterable, info, args))
+        # Cursors are built from the sort key, so the planner's `only()` must
+        # not defer it to one query per row.
+        queryset = load_fields(queryset, keyset_fields).order_by(*keyset_fields)
+        page = queryset
+        after = args.get("after")
+        if after:
+            try:
+                values = decode_cursor(after)
+            except ValueError as exc:
+                raise GraphQLError(str(exc))
+            page = page.filter(keyset_filter(queryset.model, keyset_fields, values))
+
+        rows = list(page[:first + 1]) if first else list(page)
+        has_next_page = bool(first) and len(rows) > first
+        rows = rows[:first] if first else rows
+        edges = [
+            connection.Edge(
+                node=row,
+                cursor=encode_cursor(getattr(row, f) for f in keyset_fields),
+            )
+            for row in rows
+        ]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=bool(after),
+                has_next_page=has_next_page,
+            ),
+        )
+        result.iterable = queryset
+        result.length = None
+        return result
+
+    def wrap_resolve(self, parent_resolver):
+        offset_resolver = super().wrap_resolve(parent_resolver)
+        keyset_resolver = partial(
+            self.keyset_resolver,
+            parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.keyset_fields,
+        )
+
+        def resolve(root, info, **args):
+            if args.get("keyset"):
+                return keyset_resolver(root, info, **args)
+            return offset_resolver(root, info, **args)
+
+        return resolve
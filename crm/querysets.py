@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class PeerQuerySet(models.QuerySet):
+    """QuerySet that remembers which rows were fetched together.
+
+    Every model instance produced by one evaluation gets a ``_peers`` reference
+    to the whole result list, so a loader resolving a relation for one row can
+    fetch it for all of its siblings in a single query.
+    """
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if fetched:
+            return
+        link_peers(obj for obj in self._result_cache if isinstance(obj, models.Model))
+
+
+def link_peers(instances):
+    """Mark `instances` as loaded together, e.g. after a `bulk_create`."""
+    peers = list(instances)
+    if len(peers) > 1:
+        for obj in peers:
+            obj._peers = peers
+    return peers
+
+
+PeerManager = models.Manager.from_queryset(PeerQuerySet)
@@ -0,0 +1,178 @@
+"""Response cache for read-only GraphQL operations.
+
+A query's cache key combines its normalized document, operation name and
+variables with the current version counter of every model it reads. Writes
+to `Customer`, `Product` or `Order` bump that model's counter (see
+`crm.signals`, and the bulk paths in `crm.schema` and `crm.orders` that skip
+model signals), so stale entries are never read again and simply age out.
+
+The counters live in a Django cache (`CRM_VERSION_CACHE`) so every process
+shares them; configure a shared backend such as Redis, or writes from cron,
+Celery and other workers go unseen (system check `crm.W001` warns about it). Cached
+responses go to the backend named by `CRM_RESPONSE_CACHE_BACKEND`:
+`LocMemResponseBackend` by default, or any class taking the same options,
+e.g. `DjangoCacheResponseBackend`.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+from graphql import OperationType, TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+
+from crm.documents import LRUStore
+
+VERSION_KEY = "crm:version:{}"
+
+
+def _version_cache():
+    return caches[getattr(settings, "CRM_VERSION_CACHE", "default")]
+
+
+def bump_versions(*models):
+    """Invalidate cached responses that read any of `models`, once committed."""
+    keys = [VERSION_KEY.format(model._meta.label_lower) for model in models]
+
+    def bump():
+        cache = _version_cache()
+        for key in keys:
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_versions(models):
+    keys = sorted(VERSION_KEY.format(model._meta.label_lower) for model in models)
+    found = _version_cache().get_many(keys)
+    return [(key, found.get(key, 0)) for key in keys]
+
+
+class LocMemResponseBackend:
+    """Per-process LRU with a TTL."""
+
+    def __init__(self, max_entries=1000, ttl=60, **options):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DjangoCacheResponseBackend:
+    """Store responses in a configured Django cache, shared across processes.
+
+    `max_entries` is left to the cache backend's own `OPTIONS`.
+    """
+
+    def __init__(self, ttl=60, alias="default", **options):
+        self.ttl = ttl
+        self.alias = alias
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, timeout=self.ttl)
+
+
+def _model_for(graphql_type):
+    meta = getattr(getattr(graphql_type, "graphene_type", None), "_meta", None)
+    if getattr(meta, "node", None) is not None:
+        meta = meta.node._meta
+    return getattr(meta, "model", None)
+
+
+def operation_models(schema, document, operation):
+    """Return the models read by `operation`, or None if any root field is not model-backed."""
+    type_info = TypeInfo(schema)
+    models = set()
+    roots = {"model_less": False}
+
+    class Collector(Visitor):
+        def enter_field(self, node, key, parent, path, ancestors):
+            model = _model_for(get_named_type(type_info.get_type()))
+            if model is not None:
+                models.add(model)
+            elif type_info.get_parent_type() is schema.query_type and node.name.value != "__typename":
+                roots["model_less"] = True
+
+    visit(document, TypeInfoVisitor(type_info, Collector()))
+    if roots["model_less"] or not models:
+        return None
+    return models
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._dependencies = LRUStore(getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", 1000))
+
+    def key_for(self, schema, document, operation_ast, variables, replica=False):
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return None
+        dependency_key = (id(schema), id(document))
+        cached = self._dependencies.get(dependency_key)
+        if cached is None or cached[0] is not document:
+            cached = (document, operation_models(schema, document, operation_ast), print_ast(document))
+            self._dependencies.set(dependency_key, cached)
+        _, models, normalized = cached
+        if models is None:
+            return None
+        payload = json.dumps(
+            [normalized, operation_ast.name.value if operation_ast.name else None,
+             variables or {}, get_versions(models), replica],
+            sort_keys=True, cls=DjangoJSONEncoder,
+        )
+        return "crm:response:" + hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, data):
+        self.backend.set(key, data)
+
+
+def build_response_cache():
+    if not getattr(settings, "CRM_RESPONSE_CACHE_ENABLED", True):
+        return None
+    backend_class = import_string(getattr(
+        settings, "CRM_RESPONSE_CACHE_BACKEND", "crm.response_cache.LocMemResponseBackend"
+    ))
+    backend = backend_class(
+        max_entries=getattr(settings, "CRM_RESPONSE_CACHE_MAX_ENTRIES", 1000),
+        ttl=getattr(settings, "CRM_RESPONSE_CACHE_TTL", 60),
+        **getattr(settings, "CRM_RESPONSE_CACHE_OPTIONS", {}),
+    )
+    return ResponseCache(backend)
+
+
+response_cache = build_response_cache()
@@ -0,0 +1,187 @@
+"""Incremental revenue rollups.
+
+`record_orders` folds newly placed orders into the daily, per-customer and
+per-product rollup tables inside the caller's transaction, and `remove_orders`
+takes orders back out in the transaction that deletes them, so the rollups
+agree with the committed orders as long as every write path calls one of them.
+`rebuild` recomputes the tables from `Order` for backfills and repairs. Readers such as the `crmStats` query then
+scan one row per day (and customer or product) instead of every order.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from crm.models import Order, OrderItem, DailyRevenue, CustomerDailyRevenue, ProductDailyRevenue
+
+CENTS = Decimal('0.01')
+
+
+def order_day(value):
+    if timezone.is_aware(value):
+        return timezone.localtime(value).date()
+    return value.date()
+
+
+def _apply(model, key_fields, deltas, batch_size=500):
+    """Add `deltas` ({key tuple: {field: amount}}) onto `model` rows.
+
+    Missing rows are inserted first, then every `batch_size` keys are updated
+    by a single statement with one CASE per field.
+    """
+    if not deltas:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in deltas],
+        ignore_conflicts=True,
+        batch_size=batch_size,
+    )
+    keys = list(deltas)
+    for start in range(0, len(keys), batch_size):
+        batch = {key: Q(**dict(zip(key_fields, key))) for key in keys[start:start + batch_size]}
+        fields = {field for key in batch for field in deltas[key]}
+        model.objects.filter(reduce(or_, batch.values())).update(**{
+            field: F(field) + Case(
+                *(When(match, then=Value(deltas[key][field])) for key, match in batch.items() if field in deltas[key]),
+                default=Value(0),
+                output_field=model._meta.get_field(field),
+            )
+            for field in fields
+        })
+
+
+def _day_filter(date_from, date_to):
+    day_filter = {}
+    if date_from:
+        day_filter['day__gte'] = date_from
+    if date_to:
+        day_filter['day__lte'] = date_to
+    return day_filter
+
+
+def _counter():
+    return defaultdict(lambda: defaultdict(int))
+
+
+def record_orders(lines):
+    """Fold placed orders into the rollups.
+
+    `lines` is an iterable of `(order, [OrderItem, ...])`.
+    """
+    daily, per_customer, per_product = _counter(), _counter(), _counter()
+    for order, items in lines:
+        day = order_day(order.order_date)
+        total = Decimal(order.total_amount)
+        for bucket in (daily[(day,)], per_customer[(order.customer_id, day)]):
+            bucket['order_count'] += 1
+            bucket['revenue'] += total
+        for item in items:
+            bucket = per_product[(item.product_id, day)]
+            bucket['order_count'] += 1
+            bucket['units'] += item.quantity
+            bucket['revenue'] += item.line_total
+    with transaction.atomic():
+        _apply(DailyRevenue, ('day',), daily)
+        _apply(CustomerDailyRevenue, ('customer_id', 'day'), per_customer)
+        _apply(ProductDailyRevenue, ('product_id', 'day'), per_product)
+
+
+def remove_orders(orders):
+    """Subtract the orders in the queryset `orders` from the rollups.
+
+    Call it before deleting them, in the same transaction. Rollup rows left
+    without orders are deleted, as `rebuild` would not create them.
+    """
+    orders = orders.annotate(day=TruncDate('order_date')).order_by()
+    items = OrderItem.objects.filter(order__in=orders.values('pk')).annotate(
+        day=TruncDate('order__order_date'),
+    ).order_by()
+    daily, per_customer, per_product = _counter(), _counter(), _counter()
+    for deltas, key_fields, rows in (
+        (daily, ('day',), orders.values('day').annotate(
+            order_count=Count('id'), revenue=Sum('total_amount'),
+        )),
+        (per_customer, ('customer_id', 'day'), orders.values('customer_id', 'day').annotate(
+            order_count=Count('id'), revenue=Sum('total_amount'),
+        )),
+        (per_product, ('product_id', 'day'), items.values('product_id', 'day').annotate(
+            order_count=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum('line_total'),
+        )),
+    ):
+        for row in rows:
+            bucket = deltas[tuple(row.pop(field) for field in key_fields)]
+            for field, amount in row.items():
+                bucket[field] -= amount or 0
+    with transaction.atomic():
+        for model, key_fields, deltas in (
+            (DailyRevenue, ('day',), daily),
+            (CustomerDailyRevenue, ('customer_id', 'day'), per_customer),
+            (ProductDailyRevenue, ('product_id', 'day'), per_product),
+        ):
+            _apply(model, key_fields, deltas)
+            if deltas:
+                model.objects.filter(
+                    day__in={key[-1] for key in deltas}, order_count__lte=0,
+                ).delete()
+
+
+def rebuild(date_from=None, date_to=None, batch_size=1000):
+    """Recompute the rollups for orders placed between the given days (inclusive)."""
+    rollups = (DailyRevenue, CustomerDailyRevenue, ProductDailyRevenue)
+    day_filter = _day_filter(date_from, date_to)
+    orders = Order.objects.annotate(day=TruncDate('order_date')).filter(**day_filter)
+    items = OrderItem.objects.annotate(
+        day=TruncDate('order__order_date'),
+    ).filter(**day_filter)
+
+    with transaction.atomic():
+        for model in rollups:
+            model.objects.filter(**day_filter).delete()
+        DailyRevenue.objects.bulk_create(
+            [DailyRevenue(**row) for row in orders.values('day').annotate(
+                order_count=Count('id'), revenue=Sum('total_amount'),
+            ).order_by()],
+            batch_size=batch_size,
+        )
+        CustomerDailyRevenue.objects.bulk_create(
+            [CustomerDailyRevenue(**row) for row in orders.values('customer_id', 'day').annotate(
+                order_count=Count('id'), revenue=Sum('total_amount'),
+            ).order_by()],
+            batch_size=batch_size,
+        )
+        ProductDailyRevenue.objects.bulk_create(
+            [ProductDailyRevenue(**row) for row in items.values('product_id', 'day').annotate(
+                order_count=Count('order_id', distinct=True),
+                units=Sum('quantity'),
+                revenue=Sum('line_total'),
+            ).order_by()],
+            batch_size=batch_size,
+        )
+    return {model.__name__: model.objects.filter(**day_filter).count() for model in rollups}
+
+
+def stats(date_from=None, date_to=None, group_by='day'):
+    """Read rollup totals between the given days, grouped by day, customer or product."""
+    day_filter = _day_filter(date_from, date_to)
+    if group_by == 'customer':
+        rows = CustomerDailyRevenue.objects.filter(**day_filter).values('customer_id').annotate(
+            order_count=Sum('order_count'), revenue=Sum('revenue'),
+        ).order_by('customer_id')
+    elif group_by == 'product':
+        rows = ProductDailyRevenue.objects.filter(**day_filter).values('product_id').annotate(
+            order_count=Sum('order_count'), units=Sum('units'), revenue=Sum('revenue'),
+        ).order_by('product_id')
+    else:
+        rows = DailyRevenue.objects.filter(**day_filter).order_by('day').values(
+            'day', 'order_count', 'revenue',
+        )
+    rows = list(rows)
+    for row in rows:
+        row['revenue'] = Decimal(str(row['revenue'] or 0)).quantize(CENTS)
+    return rows
@@ -0,0 +1,147 @@
+"""Route GraphQL query operations to read replicas.
+
+`ReplicaRouter` sends every write to `default`. Reads go to a replica only
+while a GraphQL query operation is executing (`routing`), so management
+commands, cron jobs and mutations, which read what they are about to write,
+always use the primary. Within a query operation:
+
+- one replica from `CRM_READ_REPLICAS` is picked round-robin, and every read
+  of the operation goes to it, so counts and pages agree with each other
+- reads inside `transaction.atomic` on the primary stay on the primary
+- a client that ran a mutation in the last `CRM_REPLICA_STICKY_SECONDS`
+  reads from the primary, so it sees its own writes despite replication lag;
+  `replica_stickiness_middleware` tracks this with the `crm_primary_until`
+  cookie
+- operations that may read a replica keep their response cache entries
+  apart from those that read the primary (`reads_replicas`), so a lagging
+  replica's result is never served to a client pinned to the primary
+
+Locally, replicas can be SQLite files refreshed from the primary with
+`python manage.py sync_replicas`.
+"""
+
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from graphql import OperationType
+
+STICKY_COOKIE = "crm_primary_until"
+WROTE_ATTR = "_crm_wrote"
+
+_round_robin = itertools.count()
+
+
+class RoutingState:
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.replica = None
+
+
+# Set for the duration of a GraphQL query operation; copied into the threads
+# the async view resolves fields on.
+_state = ContextVar("crm_db_routing", default=None)
+
+
+def replicas():
+    return list(getattr(settings, "CRM_READ_REPLICAS", []))
+
+
+def next_replica():
+    aliases = replicas()
+    return aliases[next(_round_robin) % len(aliases)] if aliases else None
+
+
+def sticky_seconds():
+    return getattr(settings, "CRM_REPLICA_STICKY_SECONDS", 5)
+
+
+def pinned_to_primary(request):
+    """Whether `request` comes from a client that wrote recently."""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def reads_replicas():
+    """Whether reads of the current GraphQL operation may go to a replica.
+
+    Such results may lag behind the primary, so the response cache keys them
+    apart from results read on the primary.
+    """
+    state = _state.get()
+    return state is not None and not state.primary and bool(replicas())
+
+
+def read_database(request):
+    """Alias for a read on behalf of `request` made outside a GraphQL operation."""
+    if pinned_to_primary(request):
+        return DEFAULT_DB_ALIAS
+    return next_replica() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def routing(request, operation_ast):
+    """Let reads of the operation in `operation_ast` use a replica where allowed."""
+    if operation_ast.operation != OperationType.QUERY:
+        setattr(request, WROTE_ATTR, True)
+        yield
+        return
+    token = _state.set(RoutingState(primary=pinned_to_primary(request)))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = next_replica() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return False if db in replicas() else None
+
+
+def _stick(request, response):
+    if getattr(request, WROTE_ATTR, False) and sticky_seconds():
+        response.set_cookie(
+            STICKY_COOKIE,
+            str(time.time() + sticky_seconds()),
+            max_age=sticky_seconds(),
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    """Pin clients to the primary for a while after they run a mutation."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _stick(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _stick(request, get_response(request))
+    return middleware
@@ -0,0 +1,374 @@
+"""Resident scheduler for `CRONJOBS` and `CELERY_BEAT_SCHEDULE`.
+
+django-crontab installs one crontab line per entry, and every tick boots a
+fresh `manage.py crontab run`: interpreter start-up, Django setup and the
+imports of the job's module, just to run a job that takes milliseconds.
+`python manage.py run_scheduler` replaces those lines, and `celery beat`, with
+one process that keeps Django set up and its database connections open:
+
+- `CRONJOBS` functions run on a bounded pool of threads. A function wrapped
+  in `crm.jobs.Job` is called at every due time, and its lease decides whether
+  an overlapping call skips or coalesces; its timeout interrupts it in the
+  pool thread (see `crm.jobs.time_limit`). Other functions are not started
+  again while their previous call is still running, and have no timeout
+- `CELERY_BEAT_SCHEDULE` tasks are sent to the broker, as `celery beat` would
+
+Cron expressions are evaluated in Django's `TIME_ZONE`, beat schedules in
+Celery's timezone. Each entry's due times are shifted by a fixed jitter of up
+to `jitter` seconds derived from its name, so entries sharing a schedule do
+not all start in the same second. The last due time of every entry is kept in
+a JSON state file; after a restart or a stall, an entry that missed runs by
+no more than `catch_up` seconds runs once, not once per missed time.
+"""
+
+import functools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from importlib import import_module
+from numbers import Number
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from crm.jobs import JobTimeout
+
+logger = logging.getLogger(__name__)
+
+ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+WEEKDAYS = {name: number for number, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+# (low, high, names) of the five cron fields; day of week 7 is Sunday too
+FIELDS = [(0, 59, {}), (0, 23, {}), (1, 31, {}), (1, 12, MONTHS), (0, 7, WEEKDAYS)]
+# How far ahead `CronSchedule.next_after` searches before giving up
+HORIZON = timedelta(days=366 * 5)
+
+
+def parse_field(text, low, high, names):
+    """Expand one cron field (`*`, `*/15`, `1-5`, `mon-fri`, `0,30`) to a set."""
+    def value(token):
+        number = names.get(token) if token in names else int(token)
+        if not low <= number <= high:
+            raise ValueError(f"{token} is outside {low}-{high}")
+        return number
+
+    values = set()
+    for part in text.lower().split(","):
+        spec, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f"Invalid step in {part!r}")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = map(value, spec.split("-", 1))
+        else:
+            start = value(spec)
+            end = high if step > 1 else start
+        if start > end:
+            raise ValueError(f"Empty range {part!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Due times of a five-field cron expression, in the timezone `tz`."""
+
+    def __init__(self, minutes, hours, days, months, weekdays, tz, text=""):
+        self.minutes = frozenset(minutes)
+        self.hours = frozenset(hours)
+        self.days = frozenset(days)
+        self.months = frozenset(months)
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.tz = tz
+        self.text = text
+
+    @classmethod
+    def parse(cls, expression, tz):
+        text = ALIASES.get(expression.strip().lower(), expression)
+        fields = text.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected five fields in cron expression {expression!r}")
+        return cls(*(
+            parse_field(field, low, high, names) for field, (low, high, names) in zip(fields, FIELDS)
+        ), tz=tz, text=expression)
+
+    @classmethod
+    def from_crontab(cls, entry, tz):
+        """Convert a `celery.schedules.crontab`."""
+        return cls(
+            entry.minute, entry.hour, entry.day_of_month, entry.month_of_year, entry.day_of_week,
+            tz=tz, text=str(entry),
+        )
+
+    def __str__(self):
+        return self.text
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        in_week = moment.isoweekday() % 7 in self.weekdays
+        # As in cron, a restricted day of month and day of week match either.
+        if len(self.days) < 31 and len(self.weekdays) < 7:
+            return in_month or in_week
+        return in_month and in_week
+
+    def next_after(self, moment):
+        """The first due time strictly after the aware datetime `moment`."""
+        local = moment.astimezone(self.tz).replace(tzinfo=None, second=0, microsecond=0)
+        limit = local + HORIZON
+        local += timedelta(minutes=1)
+        while local < limit:
+            if local.month not in self.months:
+                local = (local.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(local):
+                local = (local + timedelta(days=1)).replace(hour=0, minute=0)
+            elif local.hour not in self.hours:
+                local = (local + timedelta(hours=1)).replace(minute=0)
+            elif local.minute not in self.minutes:
+                local += timedelta(minutes=1)
+            else:
+                due = local.replace(tzinfo=self.tz).astimezone(timezone.utc)
+                # A repeated hour at the end of daylight saving time can map
+                # back to the past.
+                if due > moment:
+                    return due
+                local += timedelta(minutes=1)
+        raise ValueError(f"Cron expression {self.text!r} is never due")
+
+
+class IntervalSchedule:
+    """Due every `interval` after the previous due time."""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def __str__(self):
+        return f"every {self.interval.total_seconds():g}s"
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+
+def beat_schedule(schedule, tz):
+    from celery.schedules import crontab
+    from celery.schedules import schedule as celery_schedule
+
+    if isinstance(schedule, crontab):
+        return CronSchedule.from_crontab(schedule, tz)
+    if isinstance(schedule, celery_schedule):
+        return IntervalSchedule(schedule.run_every)
+    if isinstance(schedule, timedelta):
+        return IntervalSchedule(schedule)
+    if isinstance(schedule, Number):
+        return IntervalSchedule(timedelta(seconds=schedule))
+    raise ValueError(f"Unsupported beat schedule {schedule!r}")
+
+
+class Entry:
+    """One scheduled job, its next due time and its statistics."""
+
+    def __init__(self, name, schedule, call, guarded=False, jitter=0, path=None):
+        self.name = name
+        # Dotted path of a CRONJOBS function, which cron booted Django to run
+        self.path = path
+        self.schedule = schedule
+        self.call = call
+        # Overlapping calls are left to the job's crm.jobs lease
+        self.guarded = guarded
+        self.offset = timedelta(seconds=(zlib.crc32(name.encode()) % 1000) / 1000 * jitter)
+        # Scheduled time (without jitter) of the next run, and of the last one
+        self.base = None
+        self.last = None
+        self.future = None
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.overlapped = 0
+        self.latency = 0.0
+        self.duration = 0.0
+        # Seconds a fresh `manage.py crontab run` spends before calling the job
+        self.boot_cost = None
+
+    @property
+    def due(self):
+        return self.base + self.offset
+
+    def schedule_after(self, moment):
+        self.base = self.schedule.next_after(moment)
+
+
+def schedule_settings():
+    """`CRONJOBS` and `CELERY_BEAT_SCHEDULE`, from `crm.settings` if Django's lack them."""
+    cronjobs = getattr(settings, "CRONJOBS", None)
+    beat = getattr(settings, "CELERY_BEAT_SCHEDULE", None)
+    if cronjobs is None and beat is None:
+        crm_settings = import_module("crm.settings")
+        cronjobs = getattr(crm_settings, "CRONJOBS", None)
+        beat = getattr(crm_settings, "CELERY_BEAT_SCHEDULE", None)
+    return cronjobs or [], beat or {}
+
+
+def build_entries(cronjobs, beat, jitter=0):
+    entries = []
+    cron_tz = ZoneInfo(settings.TIME_ZONE)
+    for expression, path, *rest in cronjobs:
+        # django-crontab entries: (schedule, function, [args, [kwargs, [suffix]]])
+        func = import_string(path)
+        args = rest[0] if len(rest) > 0 else ()
+        kwargs = rest[1] if len(rest) > 1 else {}
+        name = path if all(entry.name != path for entry in entries) else f"{path}#{len(entries)}"
+        entries.append(Entry(
+            name,
+            CronSchedule.parse(expression, cron_tz),
+            functools.partial(func, *args, **kwargs),
+            guarded=hasattr(func, "job"),
+            jitter=jitter,
+            path=path,
+        ))
+    if beat:
+        from crm.celery import app
+
+        for name, options in beat.items():
+            send = functools.partial(
+                app.send_task, options["task"], args=options.get("args", ()),
+                kwargs=options.get("kwargs", {}), **options.get("options", {}),
+            )
+            entries.append(Entry(name, beat_schedule(options["schedule"], app.timezone), send, jitter=jitter))
+    return entries
+
+
+def ensure_usable_connections():
+    """Close this thread's broken database connections; keep the healthy ones open."""
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+def process_uptime():
+    """Seconds since this process started, where /proc tells (Linux)."""
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - started / os.sysconf("SC_CLK_TCK")
+
+
+def measure_boot(path):
+    """Seconds a fresh interpreter takes to set up Django and import `path`."""
+    code = (
+        "import django; django.setup(); "
+        f"from django.utils.module_loading import import_string; import_string({path!r})"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+class Scheduler:
+    def __init__(self, entries, workers=4, catch_up=300, state_file=None):
+        self.entries = entries
+        self.catch_up = timedelta(seconds=catch_up)
+        self.state_file = state_file
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crm-scheduler")
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return {name: datetime.fromisoformat(value) for name, value in json.load(f).items()}
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        state = {entry.name: entry.last.isoformat() for entry in self.entries if entry.last}
+        with open(self.state_file, "w") as f:
+            json.dump(state, f)
+
+    def start(self, now):
+        state = self.load_state()
+        for entry in self.entries:
+            entry.last = state.get(entry.name)
+            entry.schedule_after(entry.last or now)
+
+    def execute(self, entry, due):
+        latency = (datetime.now(timezone.utc) - due).total_seconds()
+        started = time.perf_counter()
+        try:
+            ensure_usable_connections()
+            entry.call()
+        except (Exception, JobTimeout):
+            logger.exception("Scheduled job %s failed", entry.name)
+            with self._lock:
+                entry.failures += 1
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                entry.runs += 1
+                entry.latency += latency
+                entry.duration += duration
+            logger.info("Ran %s in %.1fms, %.1fms after it was due", entry.name, duration * 1000, latency * 1000)
+
+    def fire(self, entry, now):
+        due = entry.due
+        if now - due > self.catch_up:
+            entry.missed += 1
+            logger.warning("Skipped %s, due at %s: beyond the catch-up window", entry.name, due.isoformat())
+        elif not entry.guarded and entry.future is not None and not entry.future.done():
+            entry.overlapped += 1
+            logger.warning("Skipped %s: its previous run is still going", entry.name)
+        else:
+            entry.future = self.pool.submit(self.execute, entry, due)
+        # Missed due times collapse into the run above.
+        entry.last = entry.base
+        entry.schedule_after(now - entry.offset)
+        self.save_state()
+
+    def tick(self):
+        """Fire every due entry; return the seconds until the next one is due."""
+        now = datetime.now(timezone.utc)
+        for entry in self.entries:
+            if entry.due <= now:
+                self.fire(entry, now)
+        return (min(entry.due for entry in self.entries) - datetime.now(timezone.utc)).total_seconds()
+
+    def run(self, until=None):
+        self.start(datetime.now(timezone.utc))
+        try:
+            while not self.stopped.is_set():
+                wait = self.tick()
+                if until is not None:
+                    if time.monotonic() >= until:
+                        break
+                    wait = min(wait, until - time.monotonic())
+                # Wake at least once a minute, in case the clock is changed.
+                self.stopped.wait(max(0, min(wait, 60)))
+        finally:
+            self.pool.shutdown(wait=True)
+
+    def stop(self):
+        self.stopped.set()
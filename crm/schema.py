@@ -1,32 +1,116 @@
 import graphene
 from graphene import Field, List, String, Int, Float, Boolean, Mutation, InputObjectType
+from graphene.types.generic import GenericScalar
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from crm.models import Customer, Product, Order
+from crm.models import ChangeLog, Customer, JobRun, Product, Order, OrderItem
 from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.loaders import get_loaders
+from crm.optimizer import optimize_queryset
+from crm.orders import StockConflict, place_orders, restock_low_products
+from crm.pagination import CountableConnection, KeysetConnectionField
+from crm.querysets import link_peers
+from crm import changes, rollups
+from crm.response_cache import bump_versions
 import re
-from django.utils import timezone
+from django.conf import settings
+
+PHONE_PATTERN = re.compile(r"^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$")
 
 # --- Types ---
 class CustomerType(DjangoObjectType):
+    orders = List(lambda: OrderType)
+
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone")
+        fields = ("id", "name", "email", "phone", "orders")
         filterset_class = CustomerFilter
+        use_connection = True
+        connection_class = CountableConnection
+
+    def resolve_orders(root, info):
+        return get_loaders(info).customer_orders.load(root)
 
 class ProductType(DjangoObjectType):
+    orders = List(lambda: OrderType)
+
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
         filterset_class = ProductFilter
+        use_connection = True
+        connection_class = CountableConnection
+
+    def resolve_orders(root, info):
+        return get_loaders(info).product_orders.load(root)
+
+class OrderItemType(DjangoObjectType):
+    product = Field(ProductType)
+
+    class Meta:
+        model = OrderItem
+        fields = ("id", "product", "quantity", "unit_price", "line_total")
+
+    def resolve_product(root, info):
+        return get_loaders(info).order_item_product.load(root)
 
 class OrderType(DjangoObjectType):
+    customer = Field(CustomerType)
+    products = List(ProductType)
+    items = List(OrderItemType)
+
     class Meta:
         model = Order
-        fields = ("id", "customer", "products", "total_amount", "order_date")
+        fields = ("id", "customer", "products", "items", "total_amount", "order_date")
         filterset_class = OrderFilter
+        use_connection = True
+        connection_class = CountableConnection
+
+    def resolve_customer(root, info):
+        return get_loaders(info).order_customer.load(root)
+
+    def resolve_products(root, info):
+        return get_loaders(info).order_products.load(root)
+
+    def resolve_items(root, info):
+        return get_loaders(info).order_items.load(root)
+
+class ChangeType(DjangoObjectType):
+    seq = graphene.BigInt()
+    object_id = graphene.BigInt()
+    payload = GenericScalar(description="The row's column values as an object; null for set-based updates.")
+
+    class Meta:
+        model = ChangeLog
+        fields = ("seq", "model", "object_id", "action", "payload", "created_at")
+        convert_choices_to_enum = False
+
+class ChangesPage(graphene.ObjectType):
+    entries = List(ChangeType)
+    last_seq = graphene.BigInt(description="Pass as `after` to read the next page.")
+    has_more = Boolean()
+    checkpoint = graphene.BigInt(description="The consumer's stored checkpoint, if a consumer was given.")
+
+class JobRunType(DjangoObjectType):
+    class Meta:
+        model = JobRun
+        fields = ("id", "job", "status", "owner", "started_at", "finished_at", "duration_ms", "error")
+        convert_choices_to_enum = False
+
+class StatsGroupBy(graphene.Enum):
+    DAY = "day"
+    CUSTOMER = "customer"
+    PRODUCT = "product"
+
+class CrmStatsType(graphene.ObjectType):
+    day = graphene.Date()
+    customer_id = graphene.ID()
+    product_id = graphene.ID()
+    order_count = Int()
+    units = Int()
+    revenue = graphene.Decimal()
 
 # --- Inputs ---
 class CustomerInput(InputObjectType):
@@ -56,13 +140,14 @@ class CreateCustomer(graphene.Mutation):
     success = graphene.Boolean()
     errors = graphene.List(graphene.String)
 
+    @staticmethod
+    def validate_phone(phone):
+        return not phone or PHONE_PATTERN.match(phone) is not None
+
     @classmethod
     def mutate(cls, root, info, name, email, phone):
         errors = []
-        # Example phone validation
-        import re
-        pattern = r"^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$"
-        if phone and not re.match(pattern, phone):
+        if not cls.validate_phone(phone):
             errors.append("Invalid phone format.")
         if Customer.objects.filter(email=email).exists():
             errors.append("Email already exists.")
@@ -75,32 +160,52 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(Mutation):
     class Arguments:
         input = List(CustomerInput, required=True)
+        chunk_size = Int()
 
     customers = List(CustomerType)
     errors = List(String)
     success = Boolean()
 
     @classmethod
-    def mutate(cls, root, info, input):
+    def mutate(cls, root, info, input, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = getattr(settings, "CRM_BULK_CHUNK_SIZE", 1000)
+        elif chunk_size < 1:
+            return BulkCreateCustomers(customers=[], errors=["chunkSize must be positive."], success=False)
         created = []
         errors = []
+        seen_emails = set()
         with transaction.atomic():
-            for idx, data in enumerate(input):
-                err = []
-                if not CreateCustomer.validate_phone(data.get("phone")):
-                    err.append(f"[{idx}] Invalid phone format.")
-                if Customer.objects.filter(email=data["email"]).exists():
-                    err.append(f"[{idx}] Email already exists.")
-                if err:
-                    errors.extend(err)
-                    continue
-                customer = Customer.objects.create(
-                    name=data["name"],
-                    email=data["email"],
-                    phone=data.get("phone", "")
+            for start in range(0, len(input), chunk_size):
+                chunk = input[start:start + chunk_size]
+                existing = set(
+                    Customer.objects.filter(email__in={data["email"] for data in chunk})
+                    .values_list("email", flat=True)
                 )
-                created.append(customer)
-        return BulkCreateCustomers(customers=created, errors=errors, success=len(errors) == 0)
+                pending = []
+                for idx, data in enumerate(chunk, start):
+                    err = []
+                    if not CreateCustomer.validate_phone(data.get("phone")):
+                        err.append(f"[{idx}] Invalid phone format.")
+                    if data["email"] in existing:
+                        err.append(f"[{idx}] Email already exists.")
+                    elif data["email"] in seen_emails:
+                        err.append(f"[{idx}] Duplicate email in input.")
+                    if err:
+                        errors.extend(err)
+                        continue
+                    seen_emails.add(data["email"])
+                    pending.append(Customer(
+                        name=data["name"],
+                        email=data["email"],
+                        phone=data.get("phone", "")
+                    ))
+                chunk_created = Customer.objects.bulk_create(pending)
+                changes.record_instances(chunk_created, ChangeLog.CREATE)
+                created.extend(chunk_created)
+            if created:
+                bump_versions(Customer)
+        return BulkCreateCustomers(customers=link_peers(created), errors=errors, success=len(errors) == 0)
 
 class CreateProduct(Mutation):
     class Arguments:
@@ -136,35 +241,80 @@ class CreateOrder(Mutation):
 
     @classmethod
     def mutate(cls, root, info, input):
-        errors = []
         try:
-            customer = Customer.objects.get(id=input["customer_id"])
-        except Customer.DoesNotExist:
-            errors.append("Invalid customer ID.")
-            return CreateOrder(order=None, errors=errors, success=False)
-        products = Product.objects.filter(id__in=input["product_ids"])
-        if products.count() != len(input["product_ids"]):
-            errors.append("One or more product IDs are invalid.")
-        if not products:
-            errors.append("At least one product must be selected.")
+            orders, errors = place_orders([input])
+        except StockConflict as exc:
+            return CreateOrder(order=None, errors=[str(exc)], success=False)
         if errors:
-            return CreateOrder(order=None, errors=errors, success=False)
-        order_date = input.get("order_date")
-        if order_date:
-            try:
-                order_date = timezone.datetime.fromisoformat(order_date)
-            except Exception:
-                order_date = timezone.now()
-        else:
-            order_date = timezone.now()
-        total_amount = sum([float(p.price) for p in products])
-        order = Order.objects.create(
-            customer=customer,
-            order_date=order_date,
-            total_amount=total_amount
+            return CreateOrder(order=None, errors=errors[0], success=False)
+        return CreateOrder(order=orders[0], errors=[], success=True)
+
+class BulkCreateOrders(Mutation):
+    class Arguments:
+        input = List(OrderInput, required=True)
+
+    orders = List(OrderType)
+    errors = List(String)
+    success = Boolean()
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        try:
+            orders, errors = place_orders(input)
+        except StockConflict as exc:
+            return BulkCreateOrders(orders=[], errors=[str(exc)], success=False)
+        messages = [f"[{idx}] {msg}" for idx in sorted(errors) for msg in errors[idx]]
+        return BulkCreateOrders(
+            orders=[orders[idx] for idx in sorted(orders)],
+            errors=messages,
+            success=not messages,
+        )
+
+class UpdateLowStockProducts(Mutation):
+    class Arguments:
+        threshold = Int()
+        increment = Int()
+        first = Int(description="Restocked products to list (default and maximum: CRM_RESTOCK_LIST_MAX).")
+
+    success = Boolean()
+    message = String()
+    updated_count = Int()
+    updated_products = List(ProductType, description="The first restocked products, by id.")
+
+    @classmethod
+    def mutate(cls, root, info, threshold=None, increment=None, first=None):
+        if threshold is None:
+            threshold = getattr(settings, "CRM_LOW_STOCK_THRESHOLD", 10)
+        if increment is None:
+            increment = getattr(settings, "CRM_RESTOCK_INCREMENT", 10)
+        if increment <= 0:
+            return UpdateLowStockProducts(
+                success=False, message="Increment must be positive.", updated_count=0, updated_products=[]
+            )
+        list_max = getattr(settings, "CRM_RESTOCK_LIST_MAX", 100)
+        first = list_max if first is None else max(0, min(first, list_max))
+        count, ids = restock_low_products(
+            threshold, increment, getattr(settings, "CRM_RESTOCK_BATCH_SIZE", 1000), keep=first
+        )
+        products = link_peers(list(Product.objects.filter(pk__in=ids).order_by("pk")))
+        return UpdateLowStockProducts(
+            success=True,
+            message=f"Restocked {count} products with stock below {threshold} by {increment}.",
+            updated_count=count,
+            updated_products=products,
         )
-        order.products.set(products)
-        return CreateOrder(order=order, errors=[], success=True)
+
+class CheckpointChanges(Mutation):
+    class Arguments:
+        consumer = String(required=True)
+        seq = graphene.BigInt(required=True)
+
+    consumer = String()
+    seq = graphene.BigInt()
+
+    @classmethod
+    def mutate(cls, root, info, consumer, seq):
+        return CheckpointChanges(consumer=consumer, seq=changes.commit(consumer, seq))
 
 # --- Register Mutations ---
 class Mutation(graphene.ObjectType):
@@ -172,14 +322,73 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
+    checkpoint_changes = CheckpointChanges.Field()
 
 # --- Queries ---
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType)
+    hello = String(description="A simple hello world field")
+    all_customers = KeysetConnectionField(CustomerType, keyset_fields=("id",))
     all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_orders = KeysetConnectionField(OrderType, keyset_fields=("order_date", "id"))
+
+    crm_stats = List(
+        CrmStatsType,
+        from_=graphene.Date(name="from"),
+        to=graphene.Date(),
+        group_by=StatsGroupBy(default_value=StatsGroupBy.DAY.value),
+    )
+
+    changes = Field(
+        ChangesPage,
+        after=graphene.BigInt(description="Defaults to the consumer's checkpoint, or 0."),
+        first=Int(default_value=100),
+        consumer=String(),
+        models=List(String, description="Only these models: customer, product, order."),
+    )
+
+    job_runs = List(
+        JobRunType,
+        job=String(description="e.g. crm.update_low_stock"),
+        status=String(description="running, succeeded, failed, timed_out, skipped or coalesced"),
+        first=Int(default_value=50),
+    )
+
+    def resolve_hello(root, info):
+        return "Hello, GraphQL!"
+
+    def resolve_crm_stats(root, info, from_=None, to=None, group_by=StatsGroupBy.DAY):
+        return rollups.stats(from_, to, getattr(group_by, "value", group_by))
+
+    def resolve_changes(root, info, after=None, first=100, consumer=None, models=None):
+        first = max(1, min(first, getattr(settings, "CRM_CHANGES_PAGE_MAX", 1000)))
+        stored = changes.checkpoint(consumer) if consumer else None
+        if after is None:
+            after = stored or 0
+        entries = changes.read(after, first + 1, models)
+        return ChangesPage(
+            entries=entries[:first],
+            last_seq=entries[:first][-1].seq if entries else after,
+            has_more=len(entries) > first,
+            checkpoint=stored,
+        )
+
+    def resolve_job_runs(root, info, job=None, status=None, first=50):
+        runs = JobRun.objects.all()
+        if job:
+            runs = runs.filter(job=job)
+        if status:
+            runs = runs.filter(status=status)
+        return runs.order_by("-started_at", "-id")[:max(1, min(first, 500))]
+
+    def resolve_all_customers(root, info, **kwargs):
+        return optimize_queryset(Customer.objects.all(), info)
+
+    def resolve_all_products(root, info, **kwargs):
+        return optimize_queryset(Product.objects.all(), info)
 
-    def resolve_all_customers(root, info):
-        return Customer.objects.all()
+    def resolve_all_orders(root, info, **kwargs):
+        return optimize_queryset(Order.objects.all(), info)
 
 schema = graphene.Schema(query=Query, mutation=Mutation)
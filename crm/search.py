@@ -0,0 +1,156 @@
+"""Substring search over customer and product text fields.
+
+`icontains` compiles to `LIKE '%term%'`, which no B-tree index can serve, so
+the filtersets route their text lookups through `search()` instead.
+
+On SQLite every indexed table gets an FTS5 shadow table with the trigram
+tokenizer (`crm_customer_search`, `crm_product_search`) using the base table
+as external content. Triggers on the base table keep it in sync, so rows
+written by `bulk_create()` or `update()` are indexed too, and a trigram
+phrase query matches exactly what `icontains` would. On PostgreSQL the same
+lookups stay `icontains` and are served by `pg_trgm` GIN indexes on
+`UPPER(column)`, the expression Django compares against.
+
+Trigram indexes cannot answer terms shorter than three characters; those
+fall back to a plain `icontains` scan. Use `manage.py rebuild_search_index`
+to create missing indexes or repopulate them after loading data with the
+triggers disabled.
+"""
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from crm.models import Customer, Product
+
+MIN_TERM_LENGTH = 3
+
+# Model -> indexed text fields
+SEARCH_FIELDS = {
+    Customer: ("name", "email"),
+    Product: ("name",),
+}
+
+
+def index_table(model):
+    return f"{model._meta.db_table}_search"
+
+
+def _fts5_statements(model, fields):
+    table = model._meta.db_table
+    index = index_table(model)
+    columns = ", ".join(fields)
+    new_values = ", ".join(f"new.{field}" for field in fields)
+    old_values = ", ".join(f"old.{field}" for field in fields)
+    delete = (
+        f"INSERT INTO {index}({index}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old_values});"
+    )
+    insert = f"INSERT INTO {index}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+        f"{columns}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {columns} ON {table} "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+    ]
+
+
+def _trigram_statements(model, fields):
+    table = model._meta.db_table
+    return ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+        f"CREATE INDEX IF NOT EXISTS {table}_{field}_trgm "
+        f"ON {table} USING gin (UPPER({field}::text) gin_trgm_ops)"
+        for field in fields
+    ]
+
+
+def install(connection):
+    """Create the search indexes for `connection`'s vendor, if it has any.
+
+    FTS5 tables are (re)populated from their base tables as part of this.
+    """
+    if connection.vendor == "sqlite":
+        build = _fts5_statements
+    elif connection.vendor == "postgresql":
+        build = _trigram_statements
+    else:
+        return
+    with connection.cursor() as cursor:
+        for model, fields in SEARCH_FIELDS.items():
+            for statement in build(model, fields):
+                cursor.execute(statement)
+    _available.pop(connection.alias, None)
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        for model, fields in SEARCH_FIELDS.items():
+            table = model._meta.db_table
+            index = index_table(model)
+            if connection.vendor == "sqlite":
+                for suffix in ("ai", "ad", "au"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {index}_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {index}")
+            elif connection.vendor == "postgresql":
+                for field in fields:
+                    cursor.execute(f"DROP INDEX IF EXISTS {table}_{field}_trgm")
+    _available.pop(connection.alias, None)
+
+
+def rebuild(connection):
+    """Repopulate every search index from its base table."""
+    install(connection)
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for model, fields in SEARCH_FIELDS.items():
+            for field in fields:
+                cursor.execute(f"REINDEX INDEX {model._meta.db_table}_{field}_trgm")
+
+
+_available = {}
+
+
+def _has_fts5(connection):
+    if connection.alias not in _available:
+        tables = set(connection.introspection.table_names())
+        _available[connection.alias] = all(index_table(model) in tables for model in SEARCH_FIELDS)
+    return _available[connection.alias]
+
+
+def _match_expression(field, term):
+    return '{%s} : "%s"' % (field, term.replace('"', '""'))
+
+
+def matching_ids(model, field, term, using="default"):
+    """Return a subquery of `model` primary keys whose `field` contains `term`.
+
+    Returns None when the lookup should run as a plain `icontains`, either
+    because there is no FTS5 index or because `term` is too short for it.
+    """
+    connection = connections[using]
+    if len(term) < MIN_TERM_LENGTH or connection.vendor != "sqlite" or not _has_fts5(connection):
+        return None
+    index = index_table(model)
+    return RawSQL(
+        f"SELECT rowid FROM {index} WHERE {index} MATCH %s",
+        (_match_expression(field, term),),
+    )
+
+
+def search(queryset, path, model, field, term):
+    """Filter `queryset` to rows whose `path__field` contains `term`, case-insensitively.
+
+    `path` is the lookup from the queryset's model to `model` ("" for the
+    model itself, e.g. "customer" for orders by customer name).
+    """
+    if not term:
+        return queryset
+    ids = matching_ids(model, field, term, using=queryset.db)
+    if ids is None:
+        lookup = f"{path}__{field}__icontains" if path else f"{field}__icontains"
+        return queryset.filter(**{lookup: term})
+    lookup = f"{path}__in" if path else "pk__in"
+    return queryset.filter(**{lookup: ids})
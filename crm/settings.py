@@ -1,18 +1,14 @@
-# Minimal settings for the CRM app relevant to cron jobs
+# Settings for cron jobs and Celery: the project settings (database, CRM_*)
+# plus the schedulers' apps and schedules
+
+from alx_backend_graphql.settings import *  # noqa: F401,F403
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
-    'django.contrib.auth',
-    'django.contrib.contenttypes',
-    'django.contrib.sessions',
-    'django.contrib.messages',
-    'django.contrib.staticfiles',
+    *INSTALLED_APPS,
     # django-crontab integration
     'django_crontab',
     # django-celery-beat for scheduled Celery tasks
     'django_celery_beat',
-    # local app
-    'crm',
 ]
 
 # Configure django-crontab to run the heartbeat every 5 minutes and low-stock job every 12 hours
@@ -0,0 +1,38 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from crm import changes
+from crm.models import ChangeLog, Customer, Product, Order, OrderItem
+from crm.response_cache import bump_versions
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_versions(sender)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        changes.record(instance, ChangeLog.CREATE if created else ChangeLog.UPDATE)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def record_deleted(sender, instance, **kwargs):
+    changes.record(instance, ChangeLog.DELETE)
+
+
+@receiver(m2m_changed, sender=OrderItem)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_cached_order_items(sender, **kwargs):
+    bump_versions(Order, Product)
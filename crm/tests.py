@@ -0,0 +1,25 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from crm.filters import OrderFilter
+from crm.management.commands.check_order_indexes import FILTERS
+from crm.models import Order
+
+
+class OrderFilterIndexTests(TestCase):
+    def test_filters_reach_their_indexes(self):
+        for name, (data, indexes) in FILTERS.items():
+            with self.subTest(filter=name):
+                plan = OrderFilter(data, queryset=Order.objects.all()).qs.explain()
+                self.assertTrue(
+                    any(index in plan for index in indexes),
+                    f"{name} uses none of {', '.join(indexes)}:\n{plan}",
+                )
+
+    def test_filter_combinations_are_index_backed(self):
+        # Raises CommandError, failing the test, if any combination scans a
+        # table its filters should reach through an index.
+        call_command("check_order_indexes", database=connection.alias, stdout=StringIO(), stderr=StringIO())
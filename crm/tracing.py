@@ -0,0 +1,185 @@
+"""Opt-in per-operation tracing of resolvers and SQL.
+
+With `CRM_TRACING_ENABLED`, the GraphQL views record for every operation:
+
+- the start offset and duration of each field resolver, and the SQL
+  statements it issued (`TracingMiddleware`)
+- the number and total duration of SQL statements, through a
+  `connection.execute_wrapper`, and the statements executed more than once
+  with identical parameters
+
+The trace is returned under `extensions.tracing` in the Apollo tracing
+format (durations in nanoseconds) with an added `sql` section, unless
+`CRM_TRACING_EXTENSIONS` is False. Operations slower than
+`CRM_TRACING_SLOW_MS` are also logged to the `crm.tracing` logger, with the
+summary attached to the record as `graphql`.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TRACE_ATTR = '_crm_trace'
+# Slowest resolvers listed in a slow-operation log record
+SLOWEST_RESOLVERS = 5
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _path(path):
+    return list(path.as_list()) if path else []
+
+
+class Trace:
+    def __init__(self):
+        self.start_time = time.time()
+        self.started = time.perf_counter_ns()
+        self.duration = None
+        self.resolvers = []
+        self.sql_count = 0
+        self.sql_duration = 0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+        # The resolver entry whose call is running in this thread, if any
+        self._local = threading.local()
+
+    def resolve(self, next, root, info, **args):
+        entry = {
+            "path": _path(info.path),
+            "parentType": info.parent_type.name,
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": time.perf_counter_ns() - self.started,
+            "duration": 0,
+            "sqlCount": 0,
+        }
+        outer = getattr(self._local, "entry", None)
+        self._local.entry = entry
+        try:
+            return next(root, info, **args)
+        finally:
+            self._local.entry = outer
+            entry["duration"] = time.perf_counter_ns() - self.started - entry["startOffset"]
+            self.resolvers.append(entry)
+
+    def __call__(self, execute, sql, params, many, context):
+        """`connection.execute_wrapper` hook timing each statement."""
+        started = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            entry = getattr(self._local, "entry", None)
+            with self._lock:
+                self.sql_count += 1
+                self.sql_duration += elapsed
+                self.statements[(sql, repr(params))] += 1
+                if entry is not None:
+                    entry["sqlCount"] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter_ns() - self.started
+
+    def duplicates(self):
+        return [
+            {"sql": sql, "count": count}
+            for (sql, _), count in self.statements.most_common()
+            if count > 1
+        ]
+
+    def as_extension(self):
+        return {
+            "version": 1,
+            "startTime": _iso(self.start_time),
+            "endTime": _iso(self.start_time + self.duration / 1e9),
+            "duration": self.duration,
+            "execution": {"resolvers": sorted(self.resolvers, key=lambda entry: entry["startOffset"])},
+            "sql": {
+                "count": self.sql_count,
+                "duration": self.sql_duration,
+                "duplicates": self.duplicates(),
+            },
+        }
+
+    def summary(self, operation_ast):
+        slowest = sorted(self.resolvers, key=lambda entry: entry["duration"], reverse=True)
+        return {
+            "operation": operation_ast.name.value if operation_ast.name else None,
+            "operationType": operation_ast.operation.value,
+            "durationMs": self.duration / 1e6,
+            "sqlCount": self.sql_count,
+            "sqlMs": self.sql_duration / 1e6,
+            "duplicateSql": sum(count - 1 for count in self.statements.values() if count > 1),
+            "slowestResolvers": [
+                {
+                    "path": ".".join(str(key) for key in entry["path"]),
+                    "durationMs": entry["duration"] / 1e6,
+                    "sqlCount": entry["sqlCount"],
+                }
+                for entry in slowest[:SLOWEST_RESOLVERS]
+            ],
+        }
+
+
+class TracingMiddleware:
+    """Time each resolver into the request's `Trace`, if it has one."""
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, TRACE_ATTR, None)
+        if trace is None:
+            return next(root, info, **args)
+        return trace.resolve(next, root, info, **args)
+
+
+def enabled():
+    return getattr(settings, "CRM_TRACING_ENABLED", False)
+
+
+def begin(request):
+    """Attach a new `Trace` to `request` when tracing is enabled; return it or None."""
+    if not enabled():
+        return None
+    trace = Trace()
+    setattr(request, TRACE_ATTR, trace)
+    return trace
+
+
+@contextmanager
+def recording_sql(trace):
+    """Record SQL run by this thread's connections into `trace` (a no-op for None)."""
+    if trace is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(trace))
+        yield
+
+
+def finish(trace, result, operation_ast):
+    """Close `trace`, log it if slow and add it to `result.extensions`."""
+    if trace is None:
+        return result
+    trace.finish()
+    slow_ms = getattr(settings, "CRM_TRACING_SLOW_MS", 500)
+    if slow_ms is not None and trace.duration / 1e6 >= slow_ms:
+        summary = trace.summary(operation_ast)
+        logger.warning(
+            "Slow GraphQL %s %s: %.1fms, %d SQL queries in %.1fms",
+            summary["operationType"], summary["operation"] or "(anonymous)",
+            summary["durationMs"], summary["sqlCount"], summary["sqlMs"],
+            extra={"graphql": summary},
+        )
+    if getattr(settings, "CRM_TRACING_EXTENSIONS", True):
+        result.extensions = {**(result.extensions or {}), "tracing": trace.as_extension()}
+    return result
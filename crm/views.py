@@ -0,0 +1,220 @@
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import GraphQLError, OperationType, execute, get_operation_ast
+from graphql.execution import ExecutionResult
+
+from crm import routers, tracing
+from crm.cost import CostAnalyzer, QueryTooComplex
+from crm.documents import document_cache, persisted_queries, query_hash
+from crm.response_cache import response_cache
+
+PreparedOperation = namedtuple("PreparedOperation", "document operation_ast cost result")
+
+
+class CRMGraphQLView(GraphQLView):
+    """`GraphQLView` that reuses parsed, validated documents across requests.
+
+    Query strings are looked up in `crm.documents.document_cache` by hash, and
+    requests may send just a persisted query hash in
+    `extensions.persistedQuery.sha256Hash` instead of the query text.
+    Successful query results are served from `crm.response_cache` until one
+    of the models they read changes. Operations over the cost or depth budget
+    of `crm.cost` are rejected before execution, and every response reports
+    its computed cost under `extensions.cost`, and its resolver and SQL
+    timings under `extensions.tracing` when `crm.tracing` is enabled.
+    """
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        """Serialize `execution_result`, returning `(body, status_code)`."""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    @staticmethod
+    def with_extensions(result, **extensions):
+        result.extensions = {**(result.extensions or {}), **extensions}
+        return result
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except Exception:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions if isinstance(extensions, dict) else None
+
+    def prepare_operation(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        """Resolve, parse, validate and cost the requested operation.
+
+        Returns a `PreparedOperation`. When its `document` is None the request
+        ends here and `result` is the `ExecutionResult` (or None) to return.
+        """
+        try:
+            query = persisted_queries.resolve(query, self.get_extensions(request, data))
+        except GraphQLError as e:
+            return PreparedOperation(None, None, None, ExecutionResult(errors=[e]))
+
+        if not query:
+            if show_graphiql:
+                return PreparedOperation(None, None, None, None)
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        document, errors = document_cache.get_document(
+            self.schema.graphql_schema, query, query_hash(query)
+        )
+        if errors:
+            return PreparedOperation(None, None, None, ExecutionResult(data=None, errors=errors))
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is None:
+            error = GraphQLError("Unknown or ambiguous operation name.")
+            return PreparedOperation(None, None, None, ExecutionResult(errors=[error]))
+        try:
+            cost = CostAnalyzer(self.schema.graphql_schema).check(document, operation_ast, variables)
+        except QueryTooComplex as e:
+            return PreparedOperation(None, None, None, ExecutionResult(errors=[e]))
+
+        if request.method.lower() == "get":
+            if operation_ast.operation != OperationType.QUERY:
+                if show_graphiql:
+                    return PreparedOperation(None, None, None, None)
+
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["POST"],
+                        "Can only perform a {} operation from a POST request.".format(
+                            operation_ast.operation.value
+                        ),
+                    )
+                )
+        return PreparedOperation(document, operation_ast, cost, None)
+
+    def execution_options(self, request, variables, operation_name):
+        options = {
+            "root_value": self.get_root_value(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "context_value": self.get_context(request),
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            options["execution_context_class"] = self.execution_context_class
+        return options
+
+    @staticmethod
+    def atomic_mutation(operation_ast):
+        return operation_ast.operation == OperationType.MUTATION and (
+            graphene_settings.ATOMIC_MUTATIONS is True
+            or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+        )
+
+    def execute_atomic(self, request, document, options):
+        with transaction.atomic():
+            result = execute(self.schema.graphql_schema, document, **options)
+            if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                transaction.set_rollback(True)
+        return result
+
+    def cached_result(self, document, operation_ast, variables):
+        """Return `(cache_key, data)`; `data` is None on a miss, `cache_key` if uncacheable."""
+        if response_cache is None:
+            return None, None
+        replica = routers.reads_replicas()
+        if replica and not getattr(settings, "CRM_RESPONSE_CACHE_REPLICA_RESULTS", True):
+            return None, None
+        cache_key = response_cache.key_for(
+            self.schema.graphql_schema, document, operation_ast, variables, replica=replica
+        )
+        if cache_key is None:
+            return None, None
+        return cache_key, response_cache.get(cache_key)
+
+    @staticmethod
+    def store_result(cache_key, result):
+        if cache_key is not None and not result.errors:
+            response_cache.set(cache_key, result.data)
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if getattr(request, tracing.TRACE_ATTR, None) is None:
+            return middleware
+        return list(middleware or ()) + [tracing.TracingMiddleware()]
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        document, operation_ast, cost, result = self.prepare_operation(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        if document is None:
+            return result
+        trace = tracing.begin(request)
+        try:
+            with tracing.recording_sql(trace), routers.routing(request, operation_ast):
+                result = self.execute_prepared(request, document, operation_ast, variables, operation_name)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return tracing.finish(trace, self.with_extensions(result, cost=cost), operation_ast)
+
+    def execute_prepared(self, request, document, operation_ast, variables, operation_name):
+        options = self.execution_options(request, variables, operation_name)
+        if self.atomic_mutation(operation_ast):
+            return self.execute_atomic(request, document, options)
+
+        cache_key, data = self.cached_result(document, operation_ast, variables)
+        if data is not None:
+            return ExecutionResult(data=data)
+
+        result = execute(self.schema.graphql_schema, document, **options)
+        self.store_result(cache_key, result)
+        return result
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""Seed the database with reproducible CRM data for load testing.
+
+    python seed_db.py --customers 100000 --products 5000 --orders 1000000 --seed 42
+
+Rows are generated in fixed-size chunks, and every chunk draws from its own
+random stream derived from `--seed` and the chunk number, so the same
+arguments produce the same data whatever `--workers` is. Chunks are written
+with `bulk_create`; with `--workers` > 1 they are spread over that many
+processes (except on SQLite, which allows a single writer).
+
+Distributions: product prices are log-normal, a few customers place most of
+the orders and a few products appear in most of them, orders hold one to a
+handful of products (mostly one unit of each), and order dates are spread over the `--days` days before
+today with more recent days busier. The revenue rollups are rebuilt at the end.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from multiprocessing import Pool
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management.color import no_style  # noqa: E402
+from django.db import connections, transaction  # noqa: E402
+from django.db.models import Max  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from crm import rollups  # noqa: E402
+from crm.models import Customer, Product, Order, OrderItem  # noqa: E402
+
+FIRST_NAMES = [
+    "Alice", "Bob", "Carol", "David", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy",
+    "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil", "Trent", "Victor", "Wendy", "Zara",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Mwangi", "Otieno", "Brown", "Garcia", "Kamau", "Wanjiru", "Lee", "Patel",
+    "Nguyen", "Kim", "Okafor", "Mensah", "Silva", "Rossi", "Muller", "Cohen", "Ali", "Kariuki",
+]
+ADJECTIVES = ["Pro", "Mini", "Max", "Ultra", "Lite", "Classic", "Smart", "Eco", "Plus", "Air"]
+NOUNS = [
+    "Laptop", "Phone", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Speaker",
+    "Camera", "Router", "Charger", "Printer", "Desk", "Chair", "Lamp", "Backpack",
+]
+CENTS = Decimal("0.01")
+
+# Ids orders are drawn from, loaded once the customers and products exist
+CUSTOMER_IDS = []
+PRODUCTS = []
+
+
+def init_worker(customer_ids, products):
+    global CUSTOMER_IDS, PRODUCTS
+    CUSTOMER_IDS, PRODUCTS = customer_ids, products
+
+
+def chunk_rng(seed, kind, index):
+    return random.Random(f"{seed}:{kind}:{index}")
+
+
+def skewed_index(rng, n, skew):
+    """Pick an index in [0, n), favouring low indexes more as `skew` grows."""
+    return min(int(n * rng.random() ** skew), n - 1)
+
+
+def build_customers(seed, index, start, stop, base):
+    rng = chunk_rng(seed, "customers", index)
+    customers = []
+    for i in range(base + start + 1, base + stop + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        phone = f"+2547{rng.randrange(10 ** 8):08d}" if rng.random() < 0.7 else None
+        customers.append(Customer(
+            pk=i,
+            name=f"{first} {last}",
+            email=f"{first.lower()}.{last.lower()}.{i}@example.com",
+            phone=phone,
+        ))
+    return customers
+
+
+def build_products(seed, index, start, stop, base):
+    rng = chunk_rng(seed, "products", index)
+    products = []
+    for i in range(base + start + 1, base + stop + 1):
+        price = Decimal(str(min(rng.lognormvariate(3.5, 1.0), 99999))).quantize(CENTS)
+        products.append(Product(
+            pk=i,
+            name=f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {i}",
+            price=max(price, CENTS),
+            stock=rng.randrange(0, 500),
+        ))
+    return products
+
+
+def build_orders(seed, index, start, stop, base, days, until):
+    rng = chunk_rng(seed, "orders", index)
+    orders, lines = [], []
+    for i in range(base + start + 1, base + stop + 1):
+        customer_id = CUSTOMER_IDS[skewed_index(rng, len(CUSTOMER_IDS), 3)]
+        count = min(1 + int(rng.expovariate(0.8)), 8, len(PRODUCTS))
+        products = sorted({PRODUCTS[skewed_index(rng, len(PRODUCTS), 2)] for _ in range(count)})
+        items = []
+        for product_id, price in products:
+            quantity = min(1 + int(rng.expovariate(1.5)), 5)
+            items.append(OrderItem(
+                order_id=i, product_id=product_id, quantity=quantity,
+                unit_price=price, line_total=price * quantity,
+            ))
+        age = timedelta(days=days * rng.random() ** 1.5, seconds=rng.randrange(86400))
+        orders.append(Order(
+            pk=i,
+            customer_id=customer_id,
+            order_date=until - age,
+            total_amount=sum((item.line_total for item in items), Decimal("0")),
+        ))
+        lines.extend(items)
+    return orders, lines
+
+
+@contextmanager
+def generated_order_dates():
+    """Keep the generated `order_date`s, which auto_now_add would overwrite."""
+    field = Order._meta.get_field("order_date")
+    auto_now_add, field.auto_now_add = field.auto_now_add, False
+    try:
+        yield
+    finally:
+        field.auto_now_add = auto_now_add
+
+
+def write_chunk(task):
+    kind, seed, index, start, stop, base, batch_size, days, until = task
+    with transaction.atomic():
+        if kind == "customers":
+            Customer.objects.bulk_create(build_customers(seed, index, start, stop, base), batch_size=batch_size)
+        elif kind == "products":
+            Product.objects.bulk_create(build_products(seed, index, start, stop, base), batch_size=batch_size)
+        else:
+            orders, lines = build_orders(seed, index, start, stop, base, days, until)
+            with generated_order_dates():
+                Order.objects.bulk_create(orders, batch_size=batch_size)
+            OrderItem.objects.bulk_create(lines, batch_size=batch_size)
+    return stop - start
+
+
+def run(kind, model, total, options, until=None):
+    # Primary keys are assigned here rather than by the database, so rows get
+    # the same ids whichever worker writes their chunk first.
+    base = model.objects.aggregate(top=Max("pk"))["top"] or 0
+    chunk = options.chunk_size
+    tasks = [
+        (kind, options.seed, index, start, min(start + chunk, total), base,
+         options.batch_size, options.days, until)
+        for index, start in enumerate(range(0, total, chunk))
+    ]
+    started = time.monotonic()
+    done = 0
+    if options.workers > 1 and len(tasks) > 1:
+        # Children must open their own database connections.
+        connections.close_all()
+        with Pool(options.workers, initializer=init_worker, initargs=(CUSTOMER_IDS, PRODUCTS)) as pool:
+            for written in pool.imap_unordered(write_chunk, tasks):
+                done += written
+                report(kind, done, total, started)
+    else:
+        for task in tasks:
+            done += write_chunk(task)
+            report(kind, done, total, started)
+    reset_sequence(model)
+
+
+def reset_sequence(model):
+    connection = connections[model.objects.db]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def report(kind, done, total, started):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed else 0
+    print(f"{kind}: {done}/{total} ({rate:.0f} rows/s)", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="Spread order dates over this many days.")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows generated per chunk/transaction.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT.")
+    parser.add_argument("--workers", type=int, default=1)
+    options = parser.parse_args(argv)
+    if options.workers > 1 and connections["default"].vendor == "sqlite":
+        print("SQLite allows one writer at a time; seeding in a single process.")
+        options.workers = 1
+
+    run("customers", Customer, options.customers, options)
+    run("products", Product, options.products, options)
+    init_worker(
+        list(Customer.objects.order_by("pk").values_list("pk", flat=True)),
+        list(Product.objects.order_by("pk").values_list("pk", "price")),
+    )
+    if options.orders and not (CUSTOMER_IDS and PRODUCTS):
+        parser.error("orders need customers and products")
+    # Dates count back from midnight, so a rerun on the same day matches exactly.
+    until = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    run("orders", Order, options.orders, options, until)
+
+    counts = rollups.rebuild(batch_size=options.batch_size)
+    print(f"rollups: {counts}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
+from crm import exports
+from crm.views import CRMGraphQLView
 from schema import schema
 
 urlpatterns = [
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True, schema=schema))),
+    path("export/customers", exports.export_customers),
+    path("export/orders", exports.export_orders),
 ]